@@ -1,9 +1,9 @@
 import datetime
 import os
-from zoneinfo import ZoneInfo
+import sys
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
 
-import requests
 from starlette.applications import Starlette
 from starlette.routing import Route, Mount
 import logging
@@ -13,6 +13,12 @@ from mcp.server.sse import SseServerTransport
 
 from dotenv import load_dotenv
 
+# mcp_shared/ is two directories up, at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from mcp_shared.weather_client import weather_client_from_env
+from mcp_shared.timezone_index import get_zoneinfo, timezone_index
+from mcp_shared.tool_executor import tool_executor_from_env
+
 load_dotenv()
 
 # Set up logging
@@ -24,35 +30,51 @@ logger = logging.getLogger("mcp-server")
 mcp = FastMCP(
     name="Weather and Time SSE Server"
 )
+weather_client = weather_client_from_env()
+tool_executor = tool_executor_from_env()
 
 
 @mcp.tool()
+@tool_executor.offload("io")
 def TimeTool(input_timezone):
-    "Provides the current time for a given city's timezone like Asia/Kolkata, America/New_York etc. If no timezone is provided, it returns the local time."
+    "Provides the current time for a given city's timezone like Asia/Kolkata, America/New_York etc. City or country names like Bengaluru or Japan work too. If no timezone is provided, it returns the local time."
     format = "%Y-%m-%d %H:%M:%S %Z%z"
     current_time = datetime.datetime.now()    
     if input_timezone:
         print("TimeZone", input_timezone)
-        current_time =  current_time.astimezone(ZoneInfo(input_timezone))
+        zone = timezone_index.zone(input_timezone)
+        if zone is None:
+            return f"Sorry, I couldn't find a timezone for {input_timezone}."
+        current_time =  current_time.astimezone(zone)
     return f"The current time is {current_time}."
 
+@mcp.tool()
+@tool_executor.offload("io")
+def TimeBatchTool(timezones: list[str]) -> dict:
+    "Provides the current time in several timezones or cities at once, e.g. Asia/Kolkata, London and Tokyo."
+    now = datetime.datetime.now(datetime.timezone.utc)
+    results = []
+    for name in timezones:
+        zone = timezone_index.resolve(name)
+        if zone is None:
+            results.append({"input": name, "error": "unknown timezone",
+                            "suggestions": timezone_index.suggestions(name)})
+        else:
+            results.append({"input": name, "timezone": zone, "time": str(now.astimezone(get_zoneinfo(zone)))})
+    return {"results": results}
+
 transport = SseServerTransport("/messages/")
 
 
 @mcp.tool()
-def weather_tool(location: str):
+async def weather_tool(location: str):
     """Provides weather information for a given location"""
-        
-    api_key = os.getenv("OPENWEATHERMAP_API_KEY")
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
-    response = requests.get(url)
-    data = response.json()
-    if data["cod"] == 200:
-        temp = data["main"]["temp"]
-        description = data["weather"][0]["description"]
-        return f"The weather in {location} is currently {description} with a temperature of {temp}°C."
-    else:
-        return f"Sorry, I couldn't find weather information for {location}."
+    return await weather_client.current_weather(location)
+
+@mcp.tool()
+async def weather_batch_tool(locations: list[str]) -> dict:
+    """Provides weather information for several locations at once, e.g. to compare the weather in different cities"""
+    return {"results": await weather_client.lookup_many(locations)}
     
 def check_auth(request: Request):
     auth = request.headers.get("authorization", "")
@@ -105,7 +127,27 @@ sse_app = Starlette(
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release the shared weather client and tool workers
+    await weather_client.aclose()
+    tool_executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Registered before the catch-all mount below so it stays reachable; checks the same auth as /sse
+@app.get("/weather/stats")
+def weather_stats(request: Request):
+    check_auth(request=request)
+    return weather_client.stats()
+
+@app.get("/tools/stats")
+def tool_stats(request: Request):
+    check_auth(request=request)
+    return tool_executor.stats()
+
 app.mount("/", sse_app)
 
 @app.get("/health")
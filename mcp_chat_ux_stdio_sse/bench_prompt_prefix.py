@@ -0,0 +1,113 @@
+"""
+Measures prompt prefill on consecutive turns of one conversation for the old prompt
+layout (context and question mixed in with the tool catalog, one user message) and
+the current one (static system prefix, volatile user message). ollama reuses the
+cached prefix of the previous request, so the second and later turns of the stable
+layout should only prefill the new tail.
+
+"full-catalog" puts every tool in the system prefix. "top-k" is what chat_agent
+actually sends once the catalog has more than TOOL_TOP_K tools: the retrieved tools
+change per question, so only the instruction block ahead of them is a shared prefix.
+
+    OLLAMA_HOST=http://localhost:11434 python bench_prompt_prefix.py --tools 40 --turns 6
+"""
+import argparse
+import asyncio
+import os
+import statistics
+
+import ollama
+from mcp.types import Tool
+
+from mcp_client_api import (DEFAULT_SYSTEM_PROMPT, TOOL_RETRIEVAL_MIN_SCORE, TOOL_TOP_K,
+                            get_prompt_to_identify_tool_and_arguments, get_system_prompt_to_identify_tool)
+from tool_retrieval import ToolRetrievalIndex
+
+QUESTIONS = [
+    "What's the time in Bengaluru?",
+    "And the weather in Dubai?",
+    "What's my BMI if I weigh 70kg and I'm 1.75m tall?",
+    "Is it raining in London right now?",
+    "What time is it in New York?",
+    "Compare the weather in Mumbai and Paris.",
+]
+
+
+def synthetic_tools(count: int) -> list:
+    tools = [
+        Tool(name="TimeTool", description="Provides the current time for a given city's timezone like Asia/Kolkata.",
+             inputSchema={"type": "object", "properties": {"input_timezone": {"type": "string"}}}),
+        Tool(name="weather_tool", description="Provides weather information for a given location",
+             inputSchema={"type": "object", "properties": {"location": {"type": "string"}}}),
+        Tool(name="calculate_bmi", description="Calculate BMI given weight in kg and height in meters.",
+             inputSchema={"type": "object", "properties": {"weight_kg": {"type": "number"},
+                                                           "height_m": {"type": "number"}}}),
+    ]
+    for i in range(count - len(tools)):
+        tools.append(Tool(name=f"crm_lookup_{i}", description=f"Look up record type {i} in the CRM by customer id.",
+                          inputSchema={"type": "object", "properties": {"customer_id": {"type": "string"}}}))
+    return tools
+
+
+def legacy_messages(query: str, tools: list, context: list) -> list:
+    # Layout before the prompts were split: volatile CONTEXT ahead of the tool catalog
+    tools_description = "\n".join([f"{tool.name}: {tool.description}, {tool.inputSchema}" for tool in tools])
+    prompt = ("You are a helpful assistant with access to these tools and context:\n\n"
+              f"CONTEXT: {context} \n"
+              f"{tools_description}\n"
+              "Choose the appropriate tool based on the user's question. \n"
+              f"User's Question: {query}\n"
+              "If no tool is needed, reply directly.\n\n")
+    return [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+
+def stable_messages(query: str, tools: list, context: list) -> list:
+    return [{"role": "system", "content": get_system_prompt_to_identify_tool(tool_list=tools)},
+            {"role": "user", "content": get_prompt_to_identify_tool_and_arguments(query=query, context=context)}]
+
+
+def top_k_messages(index: ToolRetrievalIndex):
+    # Same retrieval as ToolRouter.select, so the tool list matches what production sends
+    def build(query: str, tools: list, context: list) -> list:
+        return stable_messages(query, index.top_k(query, k=TOOL_TOP_K, min_score=TOOL_RETRIEVAL_MIN_SCORE), context)
+    return build
+
+
+async def run_conversation(client, model: str, build, tools: list, turns: int, keep_alive: str) -> list:
+    context, results = [], []
+    for turn in range(turns):
+        query = QUESTIONS[turn % len(QUESTIONS)]
+        response = await client.chat(model=model, messages=build(query, tools, context), keep_alive=keep_alive,
+                                     options={"num_predict": 16})
+        results.append((response.prompt_eval_count or 0, (response.prompt_eval_duration or 0) / 1e6))
+        context.append(f"Answered: {query}")
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tools", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--model", default=os.getenv("OLLAMA_MODEL", "llama3.2"))
+    parser.add_argument("--keep-alive", default=os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+    args = parser.parse_args()
+
+    client = ollama.AsyncClient(host=os.getenv("OLLAMA_HOST"))
+    tools = synthetic_tools(args.tools)
+    print(f"model={args.model} tools={len(tools)} turns={args.turns}")
+    layouts = (("legacy", legacy_messages), ("full-catalog", stable_messages),
+               ("top-k", top_k_messages(ToolRetrievalIndex(tools))))
+    for name, build in layouts:
+        # Unrelated request first so the previous layout's prefix is not reused
+        await client.chat(model=args.model, messages=[{"role": "user", "content": "ping"}],
+                          keep_alive=args.keep_alive, options={"num_predict": 1})
+        results = await run_conversation(client, args.model, build, tools, args.turns, args.keep_alive)
+        for turn, (tokens, millis) in enumerate(results, start=1):
+            print(f"{name:>14} turn {turn}: prefilled {tokens:5d} tokens in {millis:8.1f} ms")
+        later = results[1:] or results
+        print(f"{name:>14} turns 2+: mean {statistics.mean(t for t, _ in later):.0f} tokens, "
+              f"{statistics.mean(m for _, m in later):.1f} ms prefill\n")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+import asyncio
+from typing import Dict
+
+from fastapi import WebSocket
+from loguru import logger
+
+DROP = "drop"
+DISCONNECT = "disconnect"
+
+
+class ClientConnection:
+    """
+    One websocket with its own bounded outbound queue, drained by a sender task.
+    Producers never await the socket, so a slow client only ever delays itself.
+    """
+
+    def __init__(self, websocket: WebSocket, session_id: str, max_queue: int, policy: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self._sender = asyncio.create_task(self._send_loop())
+
+    def send(self, message: str) -> bool:
+        if self.closed:
+            return False
+        if self.queue.full():
+            if self.policy == DISCONNECT:
+                logger.warning(f"Session {self.session_id} is not keeping up, disconnecting it")
+                self.closed = True
+                self._sender.cancel()
+                asyncio.create_task(self._close_socket(code=1013))
+                return False
+            # Drop the oldest message, the newest (e.g. the final answer) matters most
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+        return True
+
+    async def _send_loop(self):
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send_text(message)
+                self.sent += 1
+                self.queue.task_done()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Stopped sending to session {self.session_id}: {e}")
+            self.closed = True
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def close(self, flush_timeout: float = 1.0):
+        if not self.closed and not self._sender.done():
+            self.closed = True
+            # Let already queued replies (e.g. a goodbye) go out first
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=flush_timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.closed = True
+        self._sender.cancel()
+
+
+class ConnectionManager:
+    """Addresses replies to the session that asked; broadcast is a non-blocking fan-out."""
+
+    def __init__(self, max_queue: int = 100, policy: str = DISCONNECT):
+        self.max_queue = max_queue
+        self.policy = policy
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.slow_disconnects = 0
+        self._dropped_closed = 0
+        self._sent_closed = 0
+
+    async def connect(self, websocket: WebSocket, session_id: str) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, session_id, self.max_queue, self.policy)
+        self.active_connections[session_id] = connection
+        return connection
+
+    async def disconnect(self, session_id: str):
+        connection = self.active_connections.pop(session_id, None)
+        if connection is not None:
+            await connection.close()
+            self._dropped_closed += connection.dropped
+            self._sent_closed += connection.sent
+
+    def send(self, session_id: str, message: str) -> bool:
+        connection = self.active_connections.get(session_id)
+        if connection is None:
+            return False
+        was_closed = connection.closed
+        if connection.send(message):
+            return True
+        if not was_closed and connection.closed:
+            self.slow_disconnects += 1
+        return False
+
+    def broadcast(self, message: str) -> int:
+        return sum(self.send(session_id, message) for session_id in list(self.active_connections))
+
+    def stats(self) -> dict:
+        connections = list(self.active_connections.values())
+        return {
+            "connections": len(connections),
+            "queued": sum(connection.queue.qsize() for connection in connections),
+            "max_queue_depth": max((connection.queue.qsize() for connection in connections), default=0),
+            "sent": self._sent_closed + sum(connection.sent for connection in connections),
+            "dropped": self._dropped_closed + sum(connection.dropped for connection in connections),
+            "slow_disconnects": self.slow_disconnects,
+            "queue_size": self.max_queue,
+            "policy": self.policy,
+        }
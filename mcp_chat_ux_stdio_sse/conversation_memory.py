@@ -0,0 +1,97 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+from loguru import logger
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting prompts
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = max(tokens, 1) * 4
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class ConversationMemory:
+    """
+    Per-session conversation memory with a token budget. The most recent turns are
+    kept verbatim; older turns are folded into a running summary in the background,
+    so the context rendered into prompts stays roughly the same size however long
+    the conversation gets.
+    """
+
+    def __init__(self, token_budget: int = 1500, recent_turns: int = 6,
+                 summarizer: Optional[Callable[[str, List[str]], Awaitable[str]]] = None):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summarizer = summarizer
+        self.summary = ""
+        self.turns: List[str] = []
+        self.total_turns = 0
+        self.summarized_turns = 0
+        self._pending: List[str] = []
+        self._summarizing: Optional[asyncio.Task] = None
+
+    @property
+    def summary_budget(self) -> int:
+        return self.token_budget // 3
+
+    def append(self, text: str):
+        self.turns.append(str(text))
+        self.total_turns += 1
+        self._compact()
+
+    def _recent_tokens(self) -> int:
+        return sum(estimate_tokens(turn) for turn in self.turns)
+
+    def _compact(self):
+        # Keep at least the latest turn verbatim, move the rest out once over budget
+        while len(self.turns) > 1 and (len(self.turns) > self.recent_turns
+                                       or self._recent_tokens() > self.token_budget - self.summary_budget):
+            self._pending.append(self.turns.pop(0))
+        if self._pending and (self._summarizing is None or self._summarizing.done()):
+            self._summarizing = asyncio.create_task(self._summarize())
+
+    async def _summarize(self):
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                if self.summarizer is None:
+                    raise RuntimeError("no summarizer configured")
+                summary = await self.summarizer(self.summary, batch)
+            except Exception as e:
+                logger.warning(f"Memory summarization failed, keeping a truncated transcript: {e}")
+                summary = " ".join([self.summary, *batch]).strip()
+            self.summary = truncate_to_tokens(summary, self.summary_budget)
+            self.summarized_turns += len(batch)
+
+    def render(self) -> List[str]:
+        """What goes into the prompt's CONTEXT: the summary, then the recent turns."""
+        context = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        remaining = self.token_budget - (estimate_tokens(context[0]) if context else 0)
+        recent = []
+        for turn in reversed(self.turns):
+            if remaining <= 0:
+                break
+            turn = truncate_to_tokens(turn, remaining)
+            remaining -= estimate_tokens(turn)
+            recent.append(turn)
+        return context + list(reversed(recent))
+
+    def stats(self) -> dict:
+        rendered = self.render()
+        return {
+            "turns": self.total_turns,
+            "recent_turns": len(self.turns),
+            "summarized_turns": self.summarized_turns,
+            "pending_summary_turns": len(self._pending),
+            "summary_tokens": estimate_tokens(self.summary) if self.summary else 0,
+            "context_tokens": sum(estimate_tokens(item) for item in rendered),
+            "token_budget": self.token_budget,
+        }
+
+    def close(self):
+        if self._summarizing is not None:
+            self._summarizing.cancel()
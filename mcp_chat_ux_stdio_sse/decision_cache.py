@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from loguru import logger
+
+_APOSTROPHES = re.compile(r"['\u2019]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    # "What's the time in  Bengaluru?" and "whats the time in bengaluru" share an entry.
+    # Only case, spacing, apostrophes and trailing ?!. are folded: the cached arguments come
+    # from the text, so "70.5kg" vs "705kg" or "GMT+5" vs "GMT-5" must stay different keys
+    text = _SPACES.sub(" ", _APOSTROPHES.sub("", (query or "").lower())).strip()
+    return text.rstrip("?!. ")
+
+
+def cache_key(query: str, catalog_version: int, context=None) -> str:
+    # A new catalog version invalidates every decision made against the old tool list.
+    # The selection prompt includes the conversation context, so "what's the weather there?"
+    # only reuses a decision made with the same context.
+    return hashlib.sha256(json.dumps([catalog_version, normalize_query(query), context or []],
+                                     default=str).encode()).hexdigest()
+
+
+class MemoryDecisionStore:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, decision = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return decision
+
+    def set(self, key: str, decision: dict, ttl: float):
+        self._entries[key] = (time.time() + ttl, decision)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        self._entries.clear()
+
+
+class SqliteDecisionStore:
+    """
+    Local on-disk store, so decisions survive restarts and are shared by workers on one host.
+    Reads never commit: last-used times are buffered and written with the next store.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, flush_every: int = 256):
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._used: dict = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS decisions "
+                         "(key TEXT PRIMARY KEY, decision TEXT, expires_at REAL, used_at REAL)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._db.execute("SELECT decision, expires_at FROM decisions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            # Expired rows are purged with the next store
+            return None
+        self._used[key] = now
+        if len(self._used) >= self.flush_every:
+            self._flush_used()
+            self._db.commit()
+        return json.loads(row[0])
+
+    def _flush_used(self):
+        if self._used:
+            self._db.executemany("UPDATE decisions SET used_at = ? WHERE key = ?",
+                                 [(used_at, key) for key, used_at in self._used.items()])
+            self._used.clear()
+
+    def set(self, key: str, decision: dict, ttl: float):
+        now = time.time()
+        self._used.pop(key, None)
+        self._flush_used()
+        self._db.execute("INSERT OR REPLACE INTO decisions VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(decision), now + ttl, now))
+        self._db.execute("DELETE FROM decisions WHERE expires_at < ?", (now,))
+        # Least recently used entries go first once over capacity
+        self._db.execute("DELETE FROM decisions WHERE key IN (SELECT key FROM decisions "
+                         "ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self._db.commit()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    def close(self):
+        self._flush_used()
+        self._db.commit()
+        self._db.close()
+
+
+class DecisionCache:
+    """
+    Caches tool-selection decisions ({"tool", "arguments"}) by normalized query,
+    conversation context and catalog version, so a repeated question skips the
+    selection generation.
+    Tools listed in `skip_tools` are never cached.
+    """
+
+    def __init__(self, store, ttl: float = 3600.0, skip_tools: Iterable[str] = ()):
+        self.store = store
+        self.ttl = ttl
+        self.skip_tools = set(skip_tools)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.skipped = 0
+
+    def get(self, query: str, catalog_version: int, context=None) -> Optional[dict]:
+        decision = self.store.get(cache_key(query, catalog_version, context))
+        if decision is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return decision
+
+    def put(self, query: str, catalog_version: int, decision: dict, context=None):
+        if decision["tool"] in self.skip_tools:
+            self.skipped += 1
+            return
+        self.store.set(cache_key(query, catalog_version, context), decision, self.ttl)
+        self.stores += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "store": type(self.store).__name__,
+            "entries": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "skipped": self.skipped,
+        }
+
+    def close(self):
+        self.store.close()
+
+
+def decision_cache_from_env() -> Optional[DecisionCache]:
+    # DECISION_CACHE=memory (default), sqlite or off
+    kind = os.getenv("DECISION_CACHE", "memory").lower()
+    if kind in ("off", "0", "false", ""):
+        return None
+    max_entries = int(os.getenv("DECISION_CACHE_MAX_ENTRIES", "1024"))
+    if kind == "sqlite":
+        path = os.getenv("DECISION_CACHE_PATH", "decision_cache.sqlite3")
+        store = SqliteDecisionStore(path, max_entries=max_entries)
+        logger.info(f"Tool decision cache stored in {path}")
+    else:
+        store = MemoryDecisionStore(max_entries=max_entries)
+    skip_tools = [name.strip() for name in os.getenv("DECISION_CACHE_SKIP_TOOLS", "").split(",") if name.strip()]
+    return DecisionCache(store, ttl=float(os.getenv("DECISION_CACHE_TTL_S", "3600")), skip_tools=skip_tools)
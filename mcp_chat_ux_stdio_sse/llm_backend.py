@@ -0,0 +1,324 @@
+import asyncio
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+import ollama
+from loguru import logger
+
+from llm_scheduler import FairScheduler, llm_request_context
+
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+
+def tool_call_json(name: str, arguments) -> str:
+    # Native tool calls are rendered in the same {"tool", "arguments"} shape the prompts ask for
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments or "{}")
+    return json.dumps({"tool": name, "arguments": dict(arguments or {})})
+
+
+class LLMBackend(ABC):
+    """
+    Minimal async chat interface, one implementation per model provider.
+
+    Supported options: `tools` (function schemas the model may call natively, a call
+    comes back as {"tool": ..., "arguments": ...} JSON) and `format` (a JSON schema
+    the reply is constrained to).
+    """
+
+    @abstractmethod
+    async def chat(self, messages: list, **options) -> str:
+        ...
+
+    async def stream(self, messages: list, **options) -> AsyncIterator[str]:
+        # Backends without native streaming yield the whole completion at once
+        yield await self.chat(messages, **options)
+
+
+class OllamaBackend(LLMBackend):
+    def __init__(self, model: str = "llama3.2", host: Optional[str] = None, keep_alive: Optional[str] = None):
+        self.model = model
+        # Keeps the model, and with it the cached prompt prefix, loaded between turns
+        self.keep_alive = keep_alive
+        self.client = ollama.AsyncClient(host=host)
+
+    async def chat(self, messages: list, tools: Optional[list] = None, format: Optional[dict] = None) -> str:
+        response = await self.client.chat(model=self.model, messages=messages, tools=tools, format=format,
+                                          keep_alive=self.keep_alive)
+        if response.message.tool_calls:
+            function = response.message.tool_calls[0].function
+            return tool_call_json(function.name, function.arguments)
+        return response['message']['content']
+
+    async def stream(self, messages: list, tools: Optional[list] = None,
+                     format: Optional[dict] = None) -> AsyncIterator[str]:
+        async for part in await self.client.chat(model=self.model, messages=messages, tools=tools,
+                                                 format=format, keep_alive=self.keep_alive, stream=True):
+            if part.message.tool_calls:
+                function = part.message.tool_calls[0].function
+                yield tool_call_json(function.name, function.arguments)
+            else:
+                yield part['message']['content']
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self, model: str = "gpt-4o-mini"):
+        from openai import AsyncOpenAI
+
+        self.model = model
+        self.client = AsyncOpenAI()
+
+    def _options(self, tools: Optional[list], format: Optional[dict]) -> dict:
+        options = {}
+        if tools:
+            options["tools"] = tools
+        if format:
+            options["response_format"] = {"type": "json_schema", "json_schema": {"name": "reply", "schema": format}}
+        return options
+
+    async def chat(self, messages: list, tools: Optional[list] = None, format: Optional[dict] = None) -> str:
+        completion = await self.client.chat.completions.create(model=self.model, messages=messages,
+                                                               **self._options(tools, format))
+        message = completion.choices[0].message
+        if message.tool_calls:
+            function = message.tool_calls[0].function
+            return tool_call_json(function.name, function.arguments)
+        return message.content
+
+    async def stream(self, messages: list, tools: Optional[list] = None,
+                     format: Optional[dict] = None) -> AsyncIterator[str]:
+        if tools:
+            # Tool call arguments arrive in fragments, not worth streaming
+            yield await self.chat(messages, tools=tools, format=format)
+            return
+        chunks = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True,
+                                                           **self._options(tools, format))
+        async for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class PoolEndpoint:
+    def __init__(self, host: str, backend: OllamaBackend):
+        self.host = host
+        self.backend = backend
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejected_at = 0.0
+
+
+class LLMBackendPool(LLMBackend):
+    """
+    Spreads generations over several ollama instances. Each call goes to the healthy
+    endpoint with the fewest outstanding requests. An endpoint that fails
+    `max_failures` times in a row is ejected until a background health check
+    (GET /api/tags) succeeds again.
+    """
+
+    def __init__(self, hosts: List[str], model: str = "llama3.2", max_failures: int = 3,
+                 health_check_interval: float = 10.0, health_check_timeout: float = 2.0,
+                 keep_alive: Optional[str] = None, affinity_slack: int = 2):
+        self.endpoints = [PoolEndpoint(host, OllamaBackend(model=model, host=host, keep_alive=keep_alive))
+                          for host in hosts]
+        self.affinity_slack = affinity_slack
+        self._affinity: "OrderedDict[str, PoolEndpoint]" = OrderedDict()
+        self.max_failures = max_failures
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _pick(self, exclude: tuple = ()) -> PoolEndpoint:
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._check_health_periodically())
+        # With every endpoint ejected, still try one rather than failing outright
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+        candidates = [endpoint for endpoint in candidates if endpoint.healthy] or candidates
+        best = min(candidates, key=lambda endpoint: endpoint.outstanding)
+        # Keep a session on the endpoint that already holds its prompt prefix in cache,
+        # unless that endpoint is clearly busier than the least loaded one
+        session_id, _ = llm_request_context.get()
+        sticky = self._affinity.get(session_id)
+        if sticky in candidates and sticky.outstanding <= best.outstanding + self.affinity_slack:
+            best = sticky
+        self._affinity[session_id] = best
+        self._affinity.move_to_end(session_id)
+        if len(self._affinity) > 4096:
+            self._affinity.popitem(last=False)
+        return best
+
+    def _record(self, endpoint: PoolEndpoint, error: Optional[BaseException]):
+        endpoint.requests += 1
+        if error is None:
+            endpoint.consecutive_failures = 0
+            return
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= self.max_failures:
+            self._eject(endpoint, f"{endpoint.consecutive_failures} failures: {error}")
+
+    def _eject(self, endpoint: PoolEndpoint, reason: str):
+        endpoint.healthy = False
+        endpoint.ejected_at = time.monotonic()
+        logger.warning(f"Ejecting LLM endpoint {endpoint.host} after {reason}")
+
+    async def chat(self, messages: list, **options) -> str:
+        tried = ()
+        while True:
+            endpoint = self._pick(exclude=tried)
+            tried += (endpoint,)
+            endpoint.outstanding += 1
+            try:
+                result = await endpoint.backend.chat(messages, **options)
+            except Exception as e:
+                self._record(endpoint, e)
+                # Retry once on another endpoint before giving up
+                if len(tried) >= min(2, len(self.endpoints)):
+                    raise
+                logger.warning(f"LLM endpoint {endpoint.host} failed, retrying on another endpoint: {e}")
+                continue
+            finally:
+                endpoint.outstanding -= 1
+            self._record(endpoint, None)
+            return result
+
+    async def stream(self, messages: list, **options) -> AsyncIterator[str]:
+        endpoint = self._pick()
+        endpoint.outstanding += 1
+        try:
+            async for chunk in endpoint.backend.stream(messages, **options):
+                yield chunk
+        except Exception as e:
+            self._record(endpoint, e)
+            raise
+        finally:
+            endpoint.outstanding -= 1
+        self._record(endpoint, None)
+
+    async def _check_health_periodically(self):
+        while True:
+            await asyncio.gather(*(self._check_health(endpoint) for endpoint in self.endpoints))
+            await asyncio.sleep(self.health_check_interval)
+
+    async def _check_health(self, endpoint: PoolEndpoint):
+        try:
+            await asyncio.wait_for(endpoint.backend.client.list(), timeout=self.health_check_timeout)
+        except Exception as e:
+            if endpoint.healthy:
+                self._eject(endpoint, f"failed health check: {e}")
+            return
+        # A reachable /api/tags says nothing about /api/chat, so it must not reset the
+        # failure count of an endpoint that is still in rotation
+        if endpoint.healthy:
+            return
+        # Stay out for at least one interval so a flapping endpoint isn't re-admitted straight away
+        if time.monotonic() - endpoint.ejected_at < self.health_check_interval:
+            return
+        logger.info(f"Re-admitting LLM endpoint {endpoint.host}")
+        endpoint.healthy = True
+        endpoint.consecutive_failures = 0
+
+    def stats(self) -> list:
+        return [
+            {
+                "host": endpoint.host,
+                "healthy": endpoint.healthy,
+                "outstanding": endpoint.outstanding,
+                "requests": endpoint.requests,
+                "failures": endpoint.failures,
+            }
+            for endpoint in self.endpoints
+        ]
+
+
+class LLMGate:
+    """
+    Admits generations through the fair scheduler and applies a per-call timeout.
+    A caller that is cancelled (or times out) cancels its request to the backend.
+    """
+
+    def __init__(self, backend: LLMBackend, scheduler: FairScheduler, timeout: float = 120.0,
+                 role_backends: Optional[Dict[str, LLMBackend]] = None):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.timeout = timeout
+        # e.g. tool selection and response processing can target different pools
+        self.role_backends = role_backends or {}
+
+    def _backend(self, role: Optional[str]) -> LLMBackend:
+        return self.role_backends.get(role, self.backend)
+
+    async def chat(self, messages: list, timeout: Optional[float] = None, role: Optional[str] = None,
+                   **options) -> str:
+        session_id, priority = llm_request_context.get()
+        await self.scheduler.acquire(session_id, priority)
+        try:
+            return await asyncio.wait_for(self._backend(role).chat(messages, **options), timeout=timeout or self.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"LLM call timed out after {timeout or self.timeout}s")
+            raise LLMTimeoutError("LLM call timed out") from None
+        finally:
+            self.scheduler.release()
+
+    async def stream(self, messages: list, timeout: Optional[float] = None,
+                     role: Optional[str] = None, **options) -> AsyncIterator[str]:
+        # The slot is held until the whole generation has been consumed
+        timeout = timeout or self.timeout
+        session_id, priority = llm_request_context.get()
+        await self.scheduler.acquire(session_id, priority)
+        chunks = self._backend(role).stream(messages, **options)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    # Scoped to the await only, so the deadline never fires inside the consumer's code
+                    async with asyncio.timeout(deadline - time.monotonic()):
+                        chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    logger.error(f"LLM stream timed out after {timeout}s")
+                    raise LLMTimeoutError("LLM call timed out") from None
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self.scheduler.release()
+
+
+def backend_from_env(role: Optional[str] = None) -> Optional[LLMBackend]:
+    """
+    Build the backend for `role` from the environment. Role specific settings use
+    a suffix (OLLAMA_HOSTS_TOOL_SELECTION, OLLAMA_MODEL_RESPONSE...); without a role
+    the default backend is returned, with a role None means "use the default".
+    """
+    suffix = f"_{role.upper()}" if role else ""
+    if os.getenv("LLM_BACKEND", "ollama") == "openai":
+        if role and not os.getenv(f"OPENAI_MODEL{suffix}"):
+            return None
+        return OpenAIBackend(model=os.getenv(f"OPENAI_MODEL{suffix}") or os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+
+    hosts = os.getenv(f"OLLAMA_HOSTS{suffix}")
+    model = os.getenv(f"OLLAMA_MODEL{suffix}")
+    if role and not hosts and not model:
+        return None
+    hosts = hosts or os.getenv("OLLAMA_HOSTS") or os.getenv("OLLAMA_HOST") or ""
+    model = model or os.getenv("OLLAMA_MODEL", "llama3.2")
+    keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    host_list = [host.strip() for host in hosts.split(",") if host.strip()]
+    if len(host_list) > 1:
+        return LLMBackendPool(
+            hosts=host_list,
+            model=model,
+            max_failures=int(os.getenv("OLLAMA_POOL_MAX_FAILURES", "3")),
+            health_check_interval=float(os.getenv("OLLAMA_POOL_HEALTH_CHECK_INTERVAL_S", "10")),
+            keep_alive=keep_alive,
+        )
+    return OllamaBackend(model=model, host=host_list[0] if host_list else None, keep_alive=keep_alive)
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Deque, Dict, Tuple
+
+from loguru import logger
+
+# Lower value is served first
+FIRST_TURN = 0
+CONTINUATION = 1
+BACKGROUND = 2
+
+# (session id, priority) of the LLM request being made by the current task
+llm_request_context: ContextVar[Tuple[str, int]] = ContextVar("llm_request_context", default=("default", FIRST_TURN))
+
+
+class LLMQueueFullError(Exception):
+    pass
+
+
+class FairScheduler:
+    """
+    Admits LLM requests into a fixed number of slots. Waiting requests are served
+    by priority first and round-robin across sessions within a priority, so a
+    session stuck in a multi-step loop cannot starve other users' first turns.
+    """
+
+    def __init__(self, capacity: int = 2, max_queue_depth: int = 64, max_queue_per_session: int = 4):
+        self.capacity = capacity
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_per_session = max_queue_per_session
+        self.in_flight = 0
+        self._queues: Dict[int, "OrderedDict[str, Deque[asyncio.Future]]"] = {}
+        self._depth = 0
+        self._per_session: Dict[str, int] = {}
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected = 0
+
+    async def acquire(self, session_id: str, priority: int = FIRST_TURN):
+        enqueued_at = time.monotonic()
+        if self.in_flight < self.capacity and self._depth == 0:
+            self.in_flight += 1
+            self._record_wait(enqueued_at)
+            return
+        if self._depth >= self.max_queue_depth or self._per_session.get(session_id, 0) >= self.max_queue_per_session:
+            self.rejected += 1
+            logger.warning(f"Rejecting LLM request from session {session_id}, queue depth {self._depth}")
+            raise LLMQueueFullError("The model is busy, too many requests are queued")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(priority, OrderedDict()).setdefault(session_id, deque()).append(waiter)
+        self._depth += 1
+        self._per_session[session_id] = self._per_session.get(session_id, 0) + 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed to us just as we were cancelled, pass it on
+                self.release()
+            else:
+                self._remove(priority, session_id, waiter)
+            raise
+        self._record_wait(enqueued_at)
+
+    def release(self):
+        waiter = self._next_waiter()
+        if waiter is None:
+            self.in_flight -= 1
+        else:
+            # The slot moves straight to the next waiter, in_flight stays the same
+            waiter.set_result(None)
+
+    def _next_waiter(self):
+        for priority in sorted(self._queues):
+            sessions = self._queues[priority]
+            while sessions:
+                session_id, waiters = next(iter(sessions.items()))
+                waiter = waiters.popleft()
+                self._dequeued(session_id)
+                if waiters:
+                    sessions.move_to_end(session_id)
+                else:
+                    del sessions[session_id]
+                if not waiter.done():
+                    return waiter
+        return None
+
+    def _remove(self, priority: int, session_id: str, waiter: asyncio.Future):
+        waiters = self._queues.get(priority, {}).get(session_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._dequeued(session_id)
+            if not waiters:
+                del self._queues[priority][session_id]
+
+    def _dequeued(self, session_id: str):
+        self._depth -= 1
+        self._per_session[session_id] -= 1
+        if not self._per_session[session_id]:
+            del self._per_session[session_id]
+
+    def _record_wait(self, enqueued_at: float):
+        self.admitted += 1
+        self._waits.append(time.monotonic() - enqueued_at)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(int(len(waits) * p), len(waits) - 1)], 4) if waits else 0.0
+
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "queue_depth": self._depth,
+            "queued_sessions": len(self._per_session),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "queue_wait_p50_s": percentile(0.5),
+            "queue_wait_p95_s": percentile(0.95),
+            "queue_wait_max_s": round(waits[-1], 4) if waits else 0.0,
+        }
@@ -1,21 +1,31 @@
-import ast
 import asyncio
 import json
 import os
-import re
-from typing import Dict, Optional, Union
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Union
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from mcp import ClientSession, StdioServerParameters, stdio_client
-from mcp.client.sse import sse_client
-from fastmcp import Client
-from fastmcp.client.transports import StreamableHttpTransport
+from mcp import StdioServerParameters
 from openai import OpenAI
-import ollama
 import mcp.client.sse as _sse_mod
 from httpx import AsyncClient as _BaseAsyncClient
 from loguru import logger
+from session_pool import MCPSessionPool
+from llm_backend import LLMBackendPool, LLMGate, LLMTimeoutError, backend_from_env
+from response_templates import fast_path_stats, looks_multi_task, render_fast_response
+from response_stream import ResponseFieldStreamer
+from connection_manager import ConnectionManager
+from conversation_memory import ConversationMemory
+from decision_cache import decision_cache_from_env
+from llm_scheduler import BACKGROUND, CONTINUATION, FIRST_TURN, FairScheduler, LLMQueueFullError, llm_request_context
+from structured_output import RESPONSE_SCHEMA, LLMOutputError, parse_llm_json, parse_stats, repair_prompt
+from tool_arguments import validation_stats
+from tool_catalog import ToolCatalog, ToolNotFoundError, ToolRoute, ToolRouter
+from tool_planner import PlanError, PlanStep, ToolPlan, execute_plan, plan_schema, plan_stats
+from turn_budget import TurnAborted, TurnBudget, turn_stats
 
 from dotenv import load_dotenv
 
@@ -30,43 +40,100 @@ async def _patched_request(self, method, url, *args, **kwargs):
     return await _orig_request(self, method, url, *args, **kwargs)
 
 httpx.AsyncClient.request = _patched_request
-def llm_client(message: str):
-    response = ollama.chat(model='llama3.2', messages=[
-        {"role": "system", "content": "You are an intelligent Assistant. You will execute tasks as instructed"},
-        {
-            'role': 'user',
-            'content': message,
-        },
-    ])
-    return response['message']['content']
 
-    # client = OpenAI()
-
-    # completion = client.chat.completions.create(
-    #     model="gpt-4o-mini",
-    #     messages=[
-    #         {"role": "system", "content": "You are an intelligent Assistant. You will execute tasks as instructed"},
-    #         {
-    #             "role": "user",
-    #             "content": message,
-    #         },
-    #     ]
-    # )
-
-    # result = completion.choices[0].message.content
-    # return result
+# Initialized MCP sessions are kept open and shared across tool calls and websocket connections
+session_pool = MCPSessionPool(
+    max_sessions_per_server=int(os.getenv("MCP_POOL_MAX_SESSIONS_PER_SERVER", "4")),
+    idle_timeout=float(os.getenv("MCP_POOL_IDLE_TIMEOUT_S", "300")),
+    health_check_after=float(os.getenv("MCP_POOL_HEALTH_CHECK_AFTER_S", "30")),
+    connect_timeout=float(os.getenv("MCP_POOL_CONNECT_TIMEOUT_S", "30")),
+    call_timeout=float(os.getenv("MCP_POOL_CALL_TIMEOUT_S", "60")),
+)
 
+# Generations run on an async backend behind a fair scheduler, so they never block the event loop
+llm_scheduler = FairScheduler(
+    capacity=int(os.getenv("LLM_MAX_CONCURRENCY", "2")),
+    max_queue_depth=int(os.getenv("LLM_MAX_QUEUE_DEPTH", "64")),
+    max_queue_per_session=int(os.getenv("LLM_MAX_QUEUE_PER_SESSION", "4")),
+)
+llm_gate = LLMGate(
+    backend=backend_from_env(),
+    scheduler=llm_scheduler,
+    timeout=float(os.getenv("LLM_TIMEOUT_S", "120")),
+    role_backends={role: backend for role in ("tool_selection", "response")
+                   if (backend := backend_from_env(role)) is not None},
+)
 
+DEFAULT_SYSTEM_PROMPT = "You are an intelligent Assistant. You will execute tasks as instructed"
 
-def get_prompt_to_identify_tool_and_arguments(query:str, tool_list:list, context=list):
-    tools_description = "\n".join([f"{tool.name}: {tool.description}, {tool.inputSchema}" for tool in tool_list])
-    # for tools in tool_list:    
-    #     tools_description = tools_description + "\n".join([f"{tool.name}: {tool.description}, {tool.inputSchema}" for tool in tools.tool])
-    return  ("You are a helpful assistant with access to these tools and context:\n\n"
-                f"CONTEXT: {context} \n"
-                f"{tools_description}\n"
+def _llm_messages(message: str, system: Optional[str] = None):
+    # The system message is the stable prefix the backend can keep cached between calls
+    return [
+        {"role": "system", "content": system or DEFAULT_SYSTEM_PROMPT},
+        {
+            'role': 'user',
+            'content': message,
+        },
+    ]
+
+async def llm_client(message: str, role: Optional[str] = None, system: Optional[str] = None, **options):
+    return await llm_gate.chat(_llm_messages(message, system), role=role, **options)
+
+async def llm_stream(message: str, role: Optional[str] = None, system: Optional[str] = None, **options):
+    async for chunk in llm_gate.stream(_llm_messages(message, system), role=role, **options):
+        yield chunk
+
+# Constrain replies with the backend's native tool calling / JSON schema support
+STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1").lower() in ("1", "true")
+LLM_PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", "1"))
+TOOL_ARGUMENT_RETRIES = int(os.getenv("TOOL_ARGUMENT_RETRIES", "1"))
+TOOL_TOP_K = int(os.getenv("TOOL_TOP_K", "5"))
+TOOL_RETRIEVAL_MIN_SCORE = float(os.getenv("TOOL_RETRIEVAL_MIN_SCORE", "0.5"))
+FAST_PATH = os.getenv("FAST_PATH", "1").lower() in ("1", "true")
+# auto: plan multi-part questions up front, always: plan every question, off: one tool per step
+PLAN_MODE = os.getenv("PLAN_MODE", "auto").lower()
+PLAN_MAX_STEPS = int(os.getenv("PLAN_MAX_STEPS", "6"))
+# Repeated first questions reuse the earlier tool decision instead of a selection generation
+decision_cache = decision_cache_from_env()
+
+async def llm_json(message: str, required: list, role: Optional[str] = None, system: Optional[str] = None,
+                   on_token: Optional[Callable] = None, **options) -> Dict:
+    prompt = message
+    for attempt in range(LLM_PARSE_RETRIES + 1):
+        if on_token is not None and attempt == 0:
+            # Forward the user-facing part of the answer while it is being generated
+            reply = ""
+            streamer = ResponseFieldStreamer()
+            async for chunk in llm_stream(prompt, role=role, system=system, **options):
+                reply += chunk
+                text = streamer.feed(chunk)
+                if text:
+                    await on_token(text)
+        else:
+            reply = await llm_client(prompt, role=role, system=system, **options)
+        logger.info(f"Response from LLM {reply}")
+        try:
+            return parse_llm_json(reply, required=required)
+        except LLMOutputError as e:
+            parse_stats.parse_failures += 1
+            if attempt == LLM_PARSE_RETRIES:
+                parse_stats.gave_up += 1
+                raise
+            parse_stats.retries += 1
+            prompt = repair_prompt(message, e)
+
+
+
+# Prompts are split into a static system part (instructions, then the tool catalog) and a volatile
+# user part (context, question), so consecutive calls share a long identical prefix
+def get_system_prompt_to_identify_tool(tool_list:list, native_tools: bool = False):
+    if native_tools:
+        # The backend already renders the tool schemas into the prompt, don't send them twice
+        tools_description = "(provided as functions)"
+    else:
+        tools_description = "\n".join([f"{tool.name}: {tool.description}, {tool.inputSchema}" for tool in tool_list])
+    return  ("You are a helpful assistant with access to tools and the conversation context.\n"
                 "Choose the appropriate tool based on the user's question. \n"
-                f"User's Question: {query}\n"                
                 "If no tool is needed, reply directly.\n\n"
                 "IMPORTANT: Always identify a single tool only."
                 "IMPORTANT: When you need to use a tool, you must ONLY respond with "                
@@ -78,9 +145,45 @@ def get_prompt_to_identify_tool_and_arguments(query:str, tool_list:list, context
                 '        "argument-name": "value"\n'
                 "    }\n"
                 "}\n\n"
+                "Available tools:\n"
+                f"{tools_description}\n"
                 )
+
+def get_prompt_to_identify_tool_and_arguments(query:str, context:list):
+    return (f"CONTEXT: {context} \n"
+            f"User's Question: {query}\n")
     
-def get_prompt_to_process_tool_response(query:str, tool_response:str, context:list):
+def get_system_prompt_to_plan_tools(tool_list:list):
+    tools_description = "\n".join([f"{tool.name}: {tool.description}, {tool.inputSchema}" for tool in tool_list])
+    return  ("You are a helpful assistant with access to tools and the conversation context.\n"
+                "Break the user's question into the tool calls needed to answer all of it.\n"
+                "Calls that need the result of another call list that call's id in depends_on and "
+                "use the placeholder {{id}} in their arguments where the result goes.\n"
+                "Independent calls must not depend on each other. Use as few calls as possible.\n"
+                "IMPORTANT: You must ONLY respond with the exact JSON object format below, DO NOT ADD any other comment.:\n"
+                "{\n"
+                '    "steps": [\n'
+                '        {"id": "s1", "tool": "tool-name", "arguments": {"argument-name": "value"}, "depends_on": []}\n'
+                "    ]\n"
+                "}\n\n"
+                "Available tools:\n"
+                f"{tools_description}\n"
+                )
+
+def get_prompt_to_fix_tool_arguments(prompt:str, tool_call:dict, error:str):
+    return (f"{prompt}\n"
+            f"Your previous answer {json.dumps(tool_call)} was rejected because the arguments are invalid: {error}\n"
+            "Correct the arguments to match the tool's input schema and answer again in the same format.\n")
+
+def get_prompt_to_summarize_memory(summary:str, turns:list):
+    return (
+        "Summarize the conversation below for an assistant that will continue it."
+        " Keep facts, names, numbers and open tasks; drop pleasantries. Use at most 120 words."
+        f"\nEarlier summary: {summary or 'none'}"
+        f"\nNew turns: {turns}"
+        )
+
+def get_system_prompt_to_process_tool_response():
     response_format = {"action":"", "response":""}
     return (
         "You are a helpful assistant."
@@ -95,10 +198,33 @@ def get_prompt_to_process_tool_response(query:str, tool_response:str, context:li
         "\nIf more processing is needed (for example, if a query has multiple tasks but only one has been handled), clearly state what’s pending and leave the action blank."
         "\nAlways follow this response format:"
         f"\n{response_format}"
-        "\n\nInputs:"
+        )
+
+def get_system_prompt_to_summarize_plan_results():
+    response_format = {"action":"respond_to_user", "response":""}
+    return (
+        "You are a helpful assistant."
+        " Several tools were run to answer the user's query. Using their results and the conversation context,"
+        " write one response that addresses every part of the query."
+        " If a tool failed, say which part could not be answered."
+        "\nAlways follow this response format:"
+        f"\n{response_format}"
+        )
+
+def get_prompt_to_summarize_plan_results(query:str, results:list, context:list):
+    return (
+        "Inputs:"
+        f"\nCONTEXT: {context}"
         f"\nUser's query: {query}"
-        f"\nTool response: {tool_response}"
+        f"\nTool results: {json.dumps(results)}"
+        )
+
+def get_prompt_to_process_tool_response(query:str, tool_response:str, context:list):
+    return (
+        "Inputs:"
         f"\nCONTEXT: {context}"
+        f"\nUser's query: {query}"
+        f"\nTool response: {tool_response}"
         )
 
 
@@ -107,90 +233,58 @@ class ToolMap(BaseModel):
     server_type: str
     tool: Dict
     params: Union[str, StdioServerParameters]
+    available: bool = True
+    error: Optional[str] = None
 
 
 class ToolList:
-    def __init__(self):
+    def __init__(self, discovery_timeout: Optional[float] = None):
         self.tools = []
-        self.tool_context = {}        
+        self.tool_context = {}
+        # Deadline applied to each server independently, a dead server can't stall the others;
+        # discovery connects are capped at it too, so a slow server fails inside the pool and is cleaned up
+        self.discovery_timeout = discovery_timeout or float(os.getenv("MCP_DISCOVERY_TIMEOUT_S", "10"))
         
     async def sse_get_tools(self, sse_url:str):
-        try:
-            logger.info("Starting  ops")            
-
-            # 1) Open SSE → yields (in_stream, out_stream)
-            async with sse_client(url=sse_url) as (in_stream, out_stream):
-                # 2) Create an MCP session over those streams
-                async with ClientSession(in_stream, out_stream) as session:
-                # 3) Initialize
-                    info = await session.initialize()
-                    logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")
-                    # 4) List tools
-                    tools = await session.list_tools()
-                    return {info.serverInfo.name: tools.tools}
-        except Exception as e:
-            # Handle the exception, e.g., log the error and return an error message
-            logger.error(f"Error getting tool context: {str(e)}")
-            return None
+        logger.info(f"Starting SSE ops {sse_url}")
+        server_name, tools = await session_pool.list_tools("sse", sse_url,
+                                                             connect_timeout=self.discovery_timeout)
+        return {server_name: tools}
 
     async def streamable_http_get_tools(self, streamable_http_url:str):
-        try:
-            logger.info("Starting HTTP ops {streamable_http_url}")
-            transport = StreamableHttpTransport(streamable_http_url)
-            # 2) Create an MCP session over those streams
-            async with Client(transport=transport) as client:
-                # 3) Initialize
-                info = await client.ping()
-                # logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")
-                # 4) List tools
-                tools = await client.list_tools()
-                return {"MCP Server Streaming HTTP": tools}
-        except Exception as e:
-            # Handle the exception, e.g., log the error and return an error message
-            logger.error(f"Error getting tool context: {str(e)}")
-            return None
+        logger.info(f"Starting HTTP ops {streamable_http_url}")
+        server_name, tools = await session_pool.list_tools("streamable-http", streamable_http_url,
+                                                             connect_timeout=self.discovery_timeout)
+        return {server_name: tools}
         
     async def stdio_get_tools(self, server_params):
+        logger.info("Starting stdio ops")
+        server_name, tools = await session_pool.list_tools("stdio", server_params,
+                                                             connect_timeout=self.discovery_timeout)
+        return {server_name: tools}
+
+    async def _discover(self, server_type: str, params, get_tools) -> ToolMap:
         try:
-            logger.info("Starting stdio ops")
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as stdio_ops_session:
-                    info = await stdio_ops_session.initialize()
-                    logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")
-                    # Get the list of available tools
-                    tools = await stdio_ops_session.list_tools()
-                    return {info.serverInfo.name: tools.tools}
+            tools = await asyncio.wait_for(get_tools(params), timeout=self.discovery_timeout)
+            return ToolMap(server_type=server_type, tool=tools, params=params)
         except Exception as e:
-            # Handle the exception, e.g., log the error and return an error message
-            logger.error(f"Error getting tool context: {str(e)}")
-            return None       
+            error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            logger.error(f"Error getting tools from {server_type} server {params}: {error}")
+            return ToolMap(server_type=server_type, tool={}, params=params, available=False, error=error)
     
     async def get_tool_context(self):
         try:
             stdio_server_params = mcp_server_config._get_server_params_list()
             sse_urls = mcp_server_config._get_sse_urls()
             streamable_http_urls = mcp_server_config._get_streamable_http_urls()
-            
-            tool_context = []
-            
-            for server_params in stdio_server_params:                
-                stdio_tools = await self.stdio_get_tools(server_params=server_params)
-                tool_map = ToolMap(server_type="stdio", tool=stdio_tools, params=server_params)
-                tool_context.append(tool_map)
-                               
-            
-            # for sse_url in sse_urls:
-            #     sse_tools = await self.sse_get_tools(sse_url=sse_url)
-            #     # tools = tool_context["sse"]
-            #     # tools.extend(sse_tools.tools)                
-            #     #tool_context["sse"]=sse_tools
-            #     tool_map = ToolMap(server_type="sse", tool=sse_tools, params=sse_url)
-            #     tool_context.append(tool_map)
-                
-            for streamable_http_url in streamable_http_urls:
-                streamable_http_tools = await self.streamable_http_get_tools(streamable_http_url=streamable_http_url)
-                tool_map = ToolMap(server_type="streamable-http", tool=streamable_http_tools, params=streamable_http_url)
-                tool_context.append(tool_map)
+
+            discoveries = (
+                [self._discover("stdio", server_params, self.stdio_get_tools) for server_params in stdio_server_params]
+                + [self._discover("sse", sse_url, self.sse_get_tools) for sse_url in sse_urls]
+                + [self._discover("streamable-http", url, self.streamable_http_get_tools) for url in streamable_http_urls]
+            )
+            # Fan out across every configured server, unavailable ones come back marked instead of raising
+            tool_context = list(await asyncio.gather(*discoveries))
 
             print(tool_context)
             
@@ -199,83 +293,96 @@ class ToolList:
             # Handle the exception, e.g., log the error and return an error message
             logger.error(f"Error getting tool context: {str(e)}")
             return None
+# Set per websocket request to receive tool_started / tool_finished events
+tool_progress: ContextVar[Optional[Callable]] = ContextVar("tool_progress", default=None)
+
 class ExecuteTool:
     
-    def __init__(self):
-        pass
+    def __init__(self, fast_path: bool = False):
+        # Render single-tool turns from a template instead of a second LLM generation
+        self.fast_path = fast_path
+
+    async def respond(self, result, tool_call: dict, query:str, memory:list, on_token: Optional[Callable] = None):
+        tool_response = result.content[0].text
+        if self.fast_path and not getattr(result, "isError", False):
+            message = render_fast_response(tool_call["tool"], tool_call["arguments"], tool_response)
+            if message is not None:
+                logger.info(f"Fast path response for {tool_call['tool']}: {message}")
+                return {"action": "respond_to_user", "response": message}
+        return await self.process_tool_response(tool_response=tool_response, query=query, memory=memory, on_token=on_token)
     
-    def process_tool_response(self, tool_response:str, query:str, memory:list):        
+    async def call(self, server_type: str, params, name: str, arguments: dict):
+        # Every tool call goes through here so the requesting client can follow its progress
+        report = tool_progress.get()
+        if report is not None:
+            report("tool_started", tool=name, arguments=arguments)
+        started = time.monotonic()
+        ok = False
+        try:
+            result = await session_pool.call_tool(server_type, params, name, arguments)
+            ok = not getattr(result, "isError", False)
+            return result
+        finally:
+            if report is not None:
+                report("tool_finished", tool=name, ok=ok, elapsed_ms=round((time.monotonic() - started) * 1000))
+
+    async def run_tool(self, route: ToolRoute, arguments: dict) -> str:
+        # Plain call without a response generation, used by the planner to fan out
+        arguments, error = route.validator(arguments)
+        if error is not None:
+            raise ValueError(f"invalid arguments: {error}")
+        result = await self.call(route.server_type, route.params, route.tool_name, arguments)
+        text = result.content[0].text if result.content else ""
+        if getattr(result, "isError", False):
+            raise RuntimeError(text or "tool reported an error")
+        return text
+
+    async def process_tool_response(self, tool_response:str, query:str, memory:list, on_token: Optional[Callable] = None):        
         response_prompt = get_prompt_to_process_tool_response(query=query,tool_response=tool_response,context=memory)
         logger.info(f"Printing tool process response prompt\n {response_prompt}")
-        final_response = llm_client(response_prompt)        
-        ##Convert string respons to dict
-        python_dict = ast.literal_eval(final_response)
-        json_string = json.dumps(python_dict)
-        json_dict = json.loads(json_string)
-        if not isinstance(json_dict,Dict): raise ValueError("response not a valid dictionary")
+        json_dict = await llm_json(response_prompt, required=["action", "response"], role="response",
+                                   system=get_system_prompt_to_process_tool_response(), on_token=on_token, **({"format": RESPONSE_SCHEMA} if STRUCTURED_OUTPUT else {}))
         logger.info(f"Process Tool Response: {json_dict}")
         return json_dict
                 
-    async def stdio_call_tool(self, query:str, memory:list, tool_call: dict, server_params):
+    async def stdio_call_tool(self, query:str, memory:list, tool_call: dict, server_params, on_token: Optional[Callable] = None):
         try:
             logger.info("Starting stdio ops")
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as stdio_ops_session:
-                    info = await stdio_ops_session.initialize()
-                    logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")
-                    
-                    result = await stdio_ops_session.call_tool(tool_call["tool"], arguments=tool_call["arguments"])
-                    print(result)
-                    tool_response = result.content[0].text
-                    return self.process_tool_response(tool_response=tool_response, query=query, memory=memory)               
-                    
+            result = await self.call("stdio", server_params, tool_call["tool"], tool_call["arguments"])
+            print(result)
+            return await self.respond(result=result, tool_call=tool_call, query=query, memory=memory, on_token=on_token)
+
+        except (LLMTimeoutError, LLMQueueFullError, LLMOutputError):
+            raise
         except Exception as e:
             # Handle the exception, e.g., log the error and return an error message
             logger.error(f"Error getting tool context: {str(e)}")
             return None
     
-    async def sse_call_tool(self, query:str, memory:list, tool_call: dict, sse_url):
+    async def sse_call_tool(self, query:str, memory:list, tool_call: dict, sse_url, on_token: Optional[Callable] = None):
         try:
             logger.info("Starting  ops")
             #sse_url = "http://localhost:8100/sse"
-
-            # 1) Open SSE → yields (in_stream, out_stream)
-            async with sse_client(url=sse_url) as (in_stream, out_stream):
-                # 2) Create an MCP session over those streams
-                async with ClientSession(in_stream, out_stream) as session:
-                # 3) Initialize
-                    info = await session.initialize()
-                    logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")                                    
-                    
-                    result = await session.call_tool(tool_call["tool"], arguments=tool_call["arguments"])
-                    print(result)
-                    tool_response = result.content[0].text
-                    return self.process_tool_response(tool_response=tool_response, query=query, memory=memory)
+            result = await self.call("sse", sse_url, tool_call["tool"], tool_call["arguments"])
+            print(result)
+            return await self.respond(result=result, tool_call=tool_call, query=query, memory=memory, on_token=on_token)
                 
+        except (LLMTimeoutError, LLMQueueFullError, LLMOutputError):
+            raise
         except Exception as e:
             # Handle the exception, e.g., log the error and return an error message
             logger.error(f"Error getting tool context: {str(e)}")
             return None
 
-    async def streamable_http_call_tool(self, query:str, memory:list, tool_call: dict, sse_url):
+    async def streamable_http_call_tool(self, query:str, memory:list, tool_call: dict, sse_url, on_token: Optional[Callable] = None):
         try:
             logger.info(f"Starting streamable HTTP ops {sse_url}")
-            #sse_url = "http://localhost:8100/sse"
-
-            # 1) Open SSE → yields (in_stream, out_stream)
-            # async with sse_client(url=sse_url) as (in_stream, out_stream):
-                # 2) Create an MCP session over those streams
-            transport = StreamableHttpTransport(sse_url)
-            async with Client(transport=transport) as client:
-                # 3) Initialize
-                info = await client.ping()
-               # logger.info(f"Connected to {info.serverInfo.name} v{info.serverInfo.version}")
-
-                result = await client.call_tool(tool_call["tool"], arguments=tool_call["arguments"])
-                print(result)
-                tool_response = result.content[0].text
-                return self.process_tool_response(tool_response=tool_response, query=query, memory=memory)
+            result = await self.call("streamable-http", sse_url, tool_call["tool"], tool_call["arguments"])
+            print(result)
+            return await self.respond(result=result, tool_call=tool_call, query=query, memory=memory, on_token=on_token)
                 
+        except (LLMTimeoutError, LLMQueueFullError, LLMOutputError):
+            raise
         except Exception as e:
             # Handle the exception, e.g., log the error and return an error message
             logger.error(f"Error getting tool context: {str(e)}")
@@ -308,40 +415,125 @@ class MCPServerConfig:
 
 
 
-async def chat_agent(query:str, memory:list,tool_context:list[ToolMap]):
-    
-    #we need this list to send to this to an LLM to tell it select a tool from this given the task
-    tools = [tool for tool_map in tool_context for tool_list in tool_map.tool.values() for tool in tool_list]    
-    logger.info(tools)    
-    
-    prompt = get_prompt_to_identify_tool_and_arguments(query=query,tool_list=tools,context=memory)
-    logger.info(f"Printing tool identification prompt\n {prompt}")
-    
-    response = llm_client(prompt)
-    logger.info(f"Response from LLM {response}")
+async def plan_agent(query:str, memory:list, router: ToolRouter, on_token: Optional[Callable] = None):
+    """
+    Plan-then-execute: one generation returns every tool call the question needs,
+    independent calls run concurrently, and one generation writes the final answer.
+    Returns None when no usable plan comes back, the caller then goes step by step.
+    """
+    tools, _ = router.select(query, k=TOOL_TOP_K, min_score=TOOL_RETRIEVAL_MIN_SCORE)
+    system_prompt = get_system_prompt_to_plan_tools(tool_list=tools)
+    prompt = get_prompt_to_identify_tool_and_arguments(query=query, context=memory)
+    structured = {"format": plan_schema([tool.name for tool in tools])} if STRUCTURED_OUTPUT else {}
+    try:
+        reply = await llm_json(prompt, required=["steps"], role="tool_selection", system=system_prompt, **structured)
+        plan = ToolPlan.from_reply(reply, max_steps=PLAN_MAX_STEPS)
+        for step in plan.steps:
+            router.resolve(step.tool)
+    except (PlanError, ToolNotFoundError, LLMOutputError) as e:
+        logger.warning(f"No usable plan for {query!r}, falling back to one tool per step: {e}")
+        plan_stats.fallbacks += 1
+        return None
+    if not plan.steps:
+        plan_stats.fallbacks += 1
+        return None
+    logger.info(f"Plan: {[[step.id for step in wave] for wave in plan.waves]} {plan.steps}")
 
-    response = re.sub(r',\s*([\]}])', r'\1', response)  # Remove trailing commas
-    tool_call = json.loads(response)    
-    
-    tool_name = tool_call["tool"]
-    logger.info(f"Tool identified by LLM: {tool_name}")    
     execute_tool_ops = ExecuteTool()
+
+    async def run_step(step: PlanStep, arguments: dict) -> str:
+        return await execute_tool_ops.run_tool(router.resolve(step.tool), arguments)
+
+    outcomes = await execute_plan(plan, run_step)
+    logger.info(f"Plan results: {outcomes}")
+    response_prompt = get_prompt_to_summarize_plan_results(query=query, results=outcomes, context=memory)
+    json_dict = await llm_json(response_prompt, required=["action", "response"], role="response",
+                               system=get_system_prompt_to_summarize_plan_results(), on_token=on_token,
+                               **({"format": RESPONSE_SCHEMA} if STRUCTURED_OUTPUT else {}))
+    # Every part was dispatched already, the summary is always the final answer
+    json_dict["action"] = "respond_to_user"
+    return json_dict
+
+
+async def chat_agent(query:str, memory:list,tool_context:list[ToolMap], router: Optional[ToolRouter] = None,
+                     on_token: Optional[Callable] = None, first_step: bool = True,
+                     catalog_version: Optional[int] = None):
+    
+    router = router or ToolRouter(tool_context)
+    multi_task = first_step and looks_multi_task(query)
+    if first_step and (PLAN_MODE == "always" or (PLAN_MODE == "auto" and multi_task)):
+        planned = await plan_agent(query, memory, router, on_token=on_token)
+        if planned is not None:
+            return planned
+    use_cache = decision_cache is not None and first_step and catalog_version is not None
+    decision = decision_cache.get(query, catalog_version, context=memory) if use_cache else None
+    if decision is not None:
+        logger.info(f"Tool decision from cache: {decision}")
+        route = router.resolve(decision["tool"])
+        arguments = decision["arguments"]
+    else:
+        #we need this list to send to this to an LLM to tell it select a tool from this given the task
+        #only the top-k tools relevant to the query go into the prompt
+        tools, structured = router.select(query, k=TOOL_TOP_K, min_score=TOOL_RETRIEVAL_MIN_SCORE)
+        logger.info(tools)    
+
+        structured = structured if STRUCTURED_OUTPUT else {}
+        system_prompt = get_system_prompt_to_identify_tool(tool_list=tools, native_tools="tools" in structured)
+        prompt = get_prompt_to_identify_tool_and_arguments(query=query,context=memory)
+        logger.info(f"Printing tool identification prompt\n {system_prompt}\n{prompt}")
+
+        selection_prompt = prompt
+        for attempt in range(TOOL_ARGUMENT_RETRIES + 1):
+            tool_call = await llm_json(selection_prompt, required=["tool", "arguments"], role="tool_selection",
+                                       system=system_prompt, **structured)
+
+            tool_name = tool_call["tool"]
+            logger.info(f"Tool identified by LLM: {tool_name}")    
+            try:
+                route = router.resolve(tool_name)
+            except ToolNotFoundError:
+                logger.error(f"Tool {tool_name} is not offered by any available MCP server")
+                return {"action": "respond_to_user",
+                        "response": f"Sorry, I could not find a tool named '{tool_name}' on any available server."}
+
+            # Check and coerce the arguments locally instead of letting the server reject them
+            arguments, error = route.validator(tool_call["arguments"])
+            if error is None:
+                break
+            logger.warning(f"Invalid arguments for {tool_name}: {error}")
+            if attempt == TOOL_ARGUMENT_RETRIES:
+                return {"action": "respond_to_user",
+                        "response": f"Sorry, I could not call {tool_name} with the details given: {error}"}
+            selection_prompt = get_prompt_to_fix_tool_arguments(prompt=prompt, tool_call=tool_call, error=error)
+        if use_cache:
+            decision_cache.put(query, catalog_version, {"tool": tool_name, "arguments": arguments}, context=memory)
+
+    # Namespaced duplicates are called by the name the owning server knows them as
+    tool_call = {"tool": route.tool_name, "arguments": arguments}
+    # Only a user's own question that asks for one thing can skip the response generation
+    execute_tool_ops = ExecuteTool(fast_path=FAST_PATH and first_step and not multi_task)
     
-    for tool_map in tool_context:
-        if tool_name in [tool.name for tool_list in tool_map.tool.values() for tool in tool_list]:
-            if tool_map.server_type == "sse":
-                result = await execute_tool_ops.sse_call_tool(query=query,memory=memory, tool_call=tool_call, sse_url=tool_map.params)
-            elif tool_map.server_type == "streamable-http":
-                result = await execute_tool_ops.streamable_http_call_tool(query=query,memory=memory, tool_call=tool_call, sse_url=tool_map.params)
-            elif tool_map.server_type == "stdio":
-                result = await execute_tool_ops.stdio_call_tool(query=query,memory=memory, tool_call=tool_call, server_params=tool_map.params)
-            break
+    if route.server_type == "sse":
+        result = await execute_tool_ops.sse_call_tool(query=query,memory=memory, tool_call=tool_call, sse_url=route.params, on_token=on_token)
+    elif route.server_type == "streamable-http":
+        result = await execute_tool_ops.streamable_http_call_tool(query=query,memory=memory, tool_call=tool_call, sse_url=route.params, on_token=on_token)
+    elif route.server_type == "stdio":
+        result = await execute_tool_ops.stdio_call_tool(query=query,memory=memory, tool_call=tool_call, server_params=route.params, on_token=on_token)
     
     return result
             
         
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tool_catalog.start()
+    yield
+    await tool_catalog.stop()
+    await session_pool.close()
+    if decision_cache is not None:
+        decision_cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -353,51 +545,239 @@ app.add_middleware(
 )
 
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: ast.List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            print(f"Active connection found: {connection}")
-            await connection.send_text(message)
+# Replies go only to the session that asked, through a bounded queue per connection
+manager = ConnectionManager(max_queue=int(os.getenv("WS_SEND_QUEUE_SIZE", "100")),
+                            policy=os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect").lower())
+
+# One catalog per process, every websocket session reads the same snapshot
+tool_catalog = ToolCatalog(loader=lambda: ToolList().get_tool_context(),
+                           ttl=float(os.getenv("TOOL_CATALOG_TTL_S", "300")),
+                           retry_after=float(os.getenv("TOOL_CATALOG_RETRY_S", "30")))
+session_pool.message_handler = tool_catalog.handle_message
+
+
+@app.get("/catalog")
+async def catalog_info():
+    return tool_catalog.info()
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "llm_scheduler": llm_scheduler.stats(),
+        "structured_output": parse_stats.as_dict(),
+        "tool_arguments": validation_stats.as_dict(),
+        "fast_path": fast_path_stats.as_dict(),
+        "plans": plan_stats.as_dict(),
+        "turns": turn_stats.as_dict(),
+        "websockets": manager.stats(),
+        "decision_cache": decision_cache.stats() if decision_cache is not None else None,
+        "llm_backends": {role or "default": backend.stats() for role, backend in
+                         [(None, llm_gate.backend), *llm_gate.role_backends.items()]
+                         if isinstance(backend, LLMBackendPool)},
+        "mcp_sessions": session_pool.stats(),
+        "tool_catalog": {key: value for key, value in tool_catalog.info().items() if key != "servers"},
+    }
+
+# Conversation memory of every connected /chat session, keyed by session id
+chat_sessions: Dict[str, ConversationMemory] = {}
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "6"))
+# Each user turn may take at most this many tool steps and this much wall-clock time
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "5"))
+AGENT_TURN_DEADLINE_S = float(os.getenv("AGENT_TURN_DEADLINE_S", "180"))
+# Requests one connection may have running at once with the JSON protocol
+WS_MAX_CONCURRENT_REQUESTS = int(os.getenv("WS_MAX_CONCURRENT_REQUESTS", "4"))
+
+async def summarize_memory(session_id: str, summary: str, turns: list) -> str:
+    # Runs in the background at the lowest priority, behind any user-facing generation
+    llm_request_context.set((session_id, BACKGROUND))
+    return await llm_client(get_prompt_to_summarize_memory(summary=summary, turns=turns), role="response")
+
+@app.get("/sessions")
+async def sessions():
+    return {session_id: memory.stats() for session_id, memory in chat_sessions.items()}
+
+def parse_frame(raw: str) -> Optional[dict]:
+    # JSON frames carry a "type"; anything else is a plain text question from an older client
+    try:
+        frame = json.loads(raw)
+    except ValueError:
+        return None
+    return frame if isinstance(frame, dict) and "type" in frame else None
 
-manager = ConnectionManager()
 @app.websocket("/chat")
 async def chat_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    """
+    Plain text frames are answered one at a time, as "Agent: ..." text or, with ?stream=1,
+    as {"type": "token"} chunks and one {"type": "end"} frame.
+
+    JSON frames multiplex requests over the connection:
+        {"type": "query", "id": "r1", "text": "..."}    start a request
+        {"type": "cancel", "id": "r1"}                  cancel it
+    and the server answers with frames carrying the same id: "accepted", "progress"
+    (tool_started / tool_finished), "token", then "end", "cancelled" or "error".
+    Up to WS_MAX_CONCURRENT_REQUESTS requests run at once, later ones wait their turn.
+    """
+    session_id = str(id(websocket))
+    await manager.connect(websocket, session_id)
+    stream = websocket.query_params.get("stream", "").lower() in ("1", "true")
+
+    # Sent through the manager so slow-consumer disconnects are counted
+    def send_frame(**frame):
+        manager.send(session_id, json.dumps(frame))
+
+    async def send_token(text: str):
+        send_frame(type="token", text=text)
+
+    async def reply(message: str):
+        if stream:
+            send_frame(type="end", text=f"Agent: {message}")
+        else:
+            manager.send(session_id, f"Agent: {message}")
+    memory = ConversationMemory(token_budget=MEMORY_TOKEN_BUDGET, recent_turns=MEMORY_RECENT_TURNS,
+                                summarizer=lambda summary, turns: summarize_memory(session_id, summary, turns))
+    chat_sessions[session_id] = memory
+
+    async def run_turn(user_input: str, on_token: Optional[Callable]) -> Optional[str]:
+        budget = TurnBudget(max_steps=AGENT_MAX_STEPS, deadline=AGENT_TURN_DEADLINE_S)
+        continuation = False
+        # The deadline cancels whatever LLM or tool call is in flight when it passes
+        async with asyncio.timeout(budget.deadline):
+            while True:
+                budget.step()
+                catalog = await tool_catalog.snapshot()
+                # A fresh question from the user is served ahead of follow-up steps of a running turn
+                llm_request_context.set((session_id, CONTINUATION if continuation else FIRST_TURN))
+                response = await chat_agent(user_input, memory.render(), catalog.tool_context, router=catalog.router,
+                                            on_token=on_token, first_step=not continuation,
+                                            catalog_version=catalog.version)
+                if response is None:
+                    # ExecuteTool logged the failure, there is nothing to remember or continue from
+                    return None
+                memory.append(response["response"])
+
+                if isinstance(response, dict) and response.get("action") == "respond_to_user":
+                    return str(response["response"])
+                user_input = response["response"]
+                continuation = True
+
+    async def answer(user_input: str, on_token: Optional[Callable]) -> tuple:
+        try:
+            message = await run_turn(user_input, on_token)
+        except LLMTimeoutError:
+            turn_stats.failed += 1
+            return "failed", "Sorry, the model took too long to respond. Please try again."
+        except LLMQueueFullError:
+            turn_stats.failed += 1
+            return "failed", "Sorry, the assistant is busy right now. Please try again shortly."
+        except LLMOutputError:
+            turn_stats.failed += 1
+            return "failed", "Sorry, I couldn't work out how to handle that. Could you rephrase it?"
+        except TurnAborted as e:
+            logger.warning(f"Turn of session {session_id} aborted: {e}")
+            return "aborted", "Sorry, that needed more steps than I'm allowed to take. Could you split it up?"
+        except TimeoutError:
+            turn_stats.deadline_exceeded += 1
+            logger.warning(f"Turn of session {session_id} passed its {AGENT_TURN_DEADLINE_S}s deadline")
+            return "aborted", "Sorry, that took too long to work out. Please try again."
+        except Exception:
+            # Anything else still gets a final frame, a client must never wait forever
+            turn_stats.failed += 1
+            logger.exception(f"Turn of session {session_id} failed")
+            return "failed", "Sorry, something went wrong while answering that. Please try again."
+        if message is None:
+            turn_stats.failed += 1
+            return "failed", "Sorry, the tool I needed to answer that failed. Please try again."
+        turn_stats.completed += 1
+        logger.info("Response from Agent: " + message)
+        return "ok", message
+
+    slots = asyncio.Semaphore(WS_MAX_CONCURRENT_REQUESTS)
+    # Plain text questions keep their order, there is no id to tell the answers apart
+    text_turns = asyncio.Lock()
+    requests: Dict[str, asyncio.Task] = {}
+
+    async def handle_text(user_input: str):
+        async with text_turns, slots:
+            status, message = await answer(user_input, send_token if stream else None)
+            await reply(message)
+
+    async def handle_query(request_id: str, user_input: str):
+        async def send_request_token(text: str):
+            send_frame(type="token", id=request_id, text=text)
+
+        async with slots:
+            tool_progress.set(lambda event, **fields: send_frame(type="progress", id=request_id, event=event, **fields))
+            status, message = await answer(user_input, send_request_token)
+            send_frame(type="end", id=request_id, status=status, text=message)
+
+    def start(key: str, coro):
+        task = asyncio.create_task(coro)
+        requests[key] = task
+        task.add_done_callback(lambda _: requests.pop(key, None) if requests.get(key) is task else None)
+
+    # Reading in the background lets a disconnect be noticed while requests are still running
+    inbox: asyncio.Queue = asyncio.Queue()
+
+    async def receive_messages():
+        try:
+            while True:
+                await inbox.put(await websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            inbox.put_nowait(None)
+
+    receiver = asyncio.create_task(receive_messages())
+    frame_count = 0
+    disconnected = False
     try:
-        memory = []
-        tool_ops = ToolList()
-        tool_context = await tool_ops.get_tool_context()
-        user_input = None
-        while True:            
-            if not user_input:
-                user_input = await websocket.receive_text()
-            
-            if user_input.lower() in ["exit", "bye", "close"]:
-                await manager.broadcast("Agent: See you later!")
+        while True:
+            raw = await inbox.get()
+            if raw is None:
+                disconnected = True
                 break
-
-            response = await chat_agent(user_input, memory, tool_context)
-            user_input = None
-            memory.append(response["response"])
-            
-            if isinstance(response, dict) and response.get("action") == "respond_to_user":
-                message = response["response"]
-                logger.info("Response from Agent: " + message)                
-                await manager.broadcast(f"Agent: {str(message)}")
+            frame = parse_frame(raw)
+            frame_count += 1
+
+            if frame is None:
+                if raw.lower() in ["exit", "bye", "close"]:
+                    async with text_turns:
+                        await reply("See you later!")
+                    break
+                start(f"text:{frame_count}", handle_text(raw))
+            elif frame["type"] == "query":
+                request_id = str(frame.get("id") or f"q{frame_count}")
+                if request_id in requests:
+                    send_frame(type="error", id=request_id, text="a request with this id is already running")
+                    continue
+                send_frame(type="accepted", id=request_id)
+                start(request_id, handle_query(request_id, str(frame.get("text", ""))))
+            elif frame["type"] == "cancel":
+                request_id = str(frame.get("id"))
+                task = requests.get(request_id)
+                if task is None:
+                    send_frame(type="error", id=request_id, text="no running request with this id")
+                    continue
+                task.cancel()
+                turn_stats.cancelled_by_client += 1
+                send_frame(type="cancelled", id=request_id)
             else:
-                user_input = response["response"]
+                send_frame(type="error", id=frame.get("id"), text=f"unknown frame type {frame['type']!r}")
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        disconnected = True
+    finally:
+        receiver.cancel()
+        if requests:
+            # Nobody is left to read the answers, stop spending shared LLM and tool capacity on them
+            logger.info(f"Session {session_id} closed with {len(requests)} request(s) in flight, cancelling them")
+            if disconnected:
+                turn_stats.cancelled_on_disconnect += len(requests)
+            for task in list(requests.values()):
+                task.cancel()
+        await manager.disconnect(session_id)
+        memory.close()
+        chat_sessions.pop(session_id, None)
             
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""
+Local stand-in for the ollama HTTP API (/api/chat, /api/tags, /api/version), for
+exercising the LLM backend pool without running real models.
+
+    python ollama_stub_server.py --port 11501 --latency 0.5
+    python ollama_stub_server.py --port 11502 --fail-rate 0.3
+    OLLAMA_HOSTS=http://localhost:11501,http://localhost:11502 python mcp_client_api.py
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+settings = {
+    "latency": 0.0,
+    "fail_rate": 0.0,
+    "reply": '{"action": "respond_to_user", "response": "This is a reply from the ollama stub."}',
+}
+
+
+def _message(model: str, content: str, done: bool, prompt_eval_count: int = 0) -> dict:
+    message = {
+        "model": model,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "message": {"role": "assistant", "content": content},
+        "done": done,
+    }
+    if done:
+        message.update({"done_reason": "stop", "prompt_eval_count": prompt_eval_count, "eval_count": 1})
+    return message
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "stub")
+    if random.random() < settings["fail_rate"]:
+        raise HTTPException(status_code=503, detail="stub failure")
+    await asyncio.sleep(settings["latency"])
+    prompt_tokens = sum(len(str(message.get("content", "")).split()) for message in body.get("messages", []))
+    reply = settings["reply"]
+    if not body.get("stream", True):
+        return _message(model, reply, done=True, prompt_eval_count=prompt_tokens)
+
+    async def tokens():
+        for i in range(0, len(reply), 8):
+            yield json.dumps(_message(model, reply[i:i + 8], done=False)) + "\n"
+            await asyncio.sleep(0.01)
+        yield json.dumps(_message(model, "", done=True, prompt_eval_count=prompt_tokens)) + "\n"
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": "llama3.2", "model": "llama3.2", "size": 0, "digest": "stub"}]}
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "0.0.0-stub"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of chat requests answered with 503")
+    parser.add_argument("--reply", default=settings["reply"])
+    args = parser.parse_args()
+    settings.update(latency=args.latency, fail_rate=args.fail_rate, reply=args.reply)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
@@ -0,0 +1,71 @@
+import json
+import re
+
+_ACTION = re.compile(r"""(["'])action\1\s*:\s*(["'])(.*?)(?<!\\)\2""", re.S)
+_RESPONSE_START = re.compile(r"""(["'])response\1\s*:\s*(["'])""")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "'": "'", "\\": "\\", "/": "/"}
+
+
+class ResponseFieldStreamer:
+    """
+    Incrementally extracts the user-facing "response" value from a generation that
+    is still being produced as {"action": ..., "response": ...} (JSON or Python dict
+    quoting). Text is only released once the action has been seen and is
+    respond_to_user, so intermediate steps are never streamed to the user.
+    """
+
+    def __init__(self, final_action: str = "respond_to_user"):
+        self.final_action = final_action
+        self.buffer = ""
+        self.action = None
+        self._pos = None
+        self._quote = None
+        self._done = False
+        self.streaming = None
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        if self._done:
+            return ""
+        if self.streaming is None:
+            start = _RESPONSE_START.search(self.buffer)
+            if start is None:
+                return ""
+            action = _ACTION.search(self.buffer, 0, start.start())
+            self.action = action.group(3) if action else None
+            # Only stream when we already know this is the final answer
+            self.streaming = self.action == self.final_action
+            self._pos = start.end()
+            self._quote = start.group(2)
+        if not self.streaming:
+            return ""
+        return self._drain()
+
+    def _drain(self) -> str:
+        out = []
+        i = self._pos
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if char == "\\":
+                if i + 1 >= len(self.buffer):
+                    break  # wait for the rest of the escape sequence
+                if self.buffer[i + 1] == "u":
+                    if i + 6 > len(self.buffer):
+                        break
+                    try:
+                        out.append(json.loads(f'"{self.buffer[i:i + 6]}"'))
+                    except ValueError:
+                        out.append(self.buffer[i:i + 6])
+                    i += 6
+                    continue
+                out.append(_ESCAPES.get(self.buffer[i + 1], self.buffer[i + 1]))
+                i += 2
+                continue
+            if char == self._quote:
+                self._done = True
+                i += 1
+                break
+            out.append(char)
+            i += 1
+        self._pos = i
+        return "".join(out)
@@ -0,0 +1,66 @@
+import json
+import os
+import re
+from typing import Dict, Optional
+
+from loguru import logger
+
+# Per-tool replies used instead of a second LLM generation when a turn clearly needed
+# just one tool. {result} is the tool's text output, other fields are the call's arguments.
+RESPONSE_TEMPLATES: Dict[str, str] = {
+    "calculate_bmi": "Your BMI for a weight of {weight_kg} kg and a height of {height_m} m is {result}.",
+    "TimeTool": "{result}",
+    "weather_tool": "{result}",
+}
+
+# Conjunctions and list markers that suggest the user asked for more than one thing
+_MULTI_TASK = re.compile(r"\b(and|also|then|plus|as well as|compare|versus|vs|both|each|after that)\b|[;&]|\?.+\?",
+                         re.I | re.S)
+
+
+class FastPathStats:
+    def __init__(self):
+        self.hits = 0
+        self.no_template = 0
+        self.multi_task = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+fast_path_stats = FastPathStats()
+
+
+def load_templates(path: Optional[str]) -> Dict[str, str]:
+    # FAST_PATH_TEMPLATES can point to a JSON file of extra or overriding templates
+    templates = dict(RESPONSE_TEMPLATES)
+    if path:
+        with open(path) as f:
+            templates.update(json.load(f))
+        logger.info(f"Loaded response templates from {path}")
+    return templates
+
+
+templates = load_templates(os.getenv("FAST_PATH_TEMPLATES"))
+
+
+def looks_multi_task(query: str) -> bool:
+    if _MULTI_TASK.search(query or ""):
+        fast_path_stats.multi_task += 1
+        return True
+    return False
+
+
+def render_fast_response(tool_name: str, arguments: dict, result: str) -> Optional[str]:
+    template = templates.get(tool_name)
+    if template is None:
+        fast_path_stats.no_template += 1
+        return None
+    try:
+        # {result} always means the tool output, even if a tool has an argument named "result"
+        text = template.format_map({**arguments, "result": result})
+    except (KeyError, IndexError, ValueError, AttributeError, TypeError):
+        fast_path_stats.no_template += 1
+        return None
+    fast_path_stats.hits += 1
+    return text
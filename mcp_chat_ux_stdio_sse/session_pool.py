@@ -0,0 +1,302 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+import anyio
+import httpx
+from fastmcp import Client
+from fastmcp.client.transports import StreamableHttpTransport
+from loguru import logger
+from mcp import ClientSession, McpError, StdioServerParameters, stdio_client
+from mcp.client.sse import sse_client
+from mcp.types import CONNECTION_CLOSED
+
+# Errors that mean the transport under a session is gone, not that a tool failed
+_TRANSPORT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                     httpx.TransportError, ConnectionError)
+
+
+def pool_key(server_type: str, params: Union[str, StdioServerParameters]) -> str:
+    # StdioServerParameters is not hashable, so key the pool on its JSON form
+    if isinstance(params, StdioServerParameters):
+        return f"{server_type}:{params.model_dump_json()}"
+    return f"{server_type}:{params}"
+
+
+class PooledSession:
+    """
+    An initialized MCP session that stays open until it is closed or evicted.
+
+    The transport context managers use anyio cancel scopes, which must be entered
+    and exited by the same task, so every session is owned by a dedicated task
+    that opens the transport, signals readiness and then waits to be closed or
+    for the transport to go away.
+    """
+
+    def __init__(self, server_type: str, params: Union[str, StdioServerParameters],
+                 message_handler: Optional[Callable] = None, call_timeout: Optional[float] = None):
+        self.server_type = server_type
+        self.params = params
+        self.message_handler = message_handler
+        self.call_timeout = call_timeout
+        self.server_name: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+        self._client = None
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._lost = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self, timeout: float):
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise TimeoutError(f"Timed out connecting to {self.params}")
+        except BaseException:
+            # caller cancelled mid-connect: tear the transport down instead of orphaning it
+            self.broken = True
+            self._task.cancel()
+            raise
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            if self.server_type == "stdio":
+                async with stdio_client(self.params) as (read, write), anyio.create_task_group() as watcher:
+                    async with ClientSession(self._watch(read, watcher), write,
+                                             message_handler=self.message_handler) as session:
+                        info = await session.initialize()
+                        await self._serve(session, info.serverInfo.name)
+                    watcher.cancel_scope.cancel()
+            elif self.server_type == "sse":
+                async with sse_client(url=self.params) as (in_stream, out_stream), anyio.create_task_group() as watcher:
+                    async with ClientSession(self._watch(in_stream, watcher), out_stream,
+                                             message_handler=self.message_handler) as session:
+                        info = await session.initialize()
+                        await self._serve(session, info.serverInfo.name)
+                    watcher.cancel_scope.cancel()
+            elif self.server_type == "streamable-http":
+                transport = StreamableHttpTransport(self.params)
+                async with Client(transport=transport, message_handler=self.message_handler) as client:
+                    await client.ping()
+                    info = getattr(client, "initialize_result", None)
+                    await self._serve(client, info.serverInfo.name if info else "MCP Server Streaming HTTP")
+            else:
+                raise ValueError(f"Unsupported server type {self.server_type}")
+        except BaseException as e:
+            if not self._ready.is_set():
+                self._error = e
+            else:
+                logger.warning(f"MCP session to {self.params} ended: {e}")
+        finally:
+            self.broken = True
+            self._ready.set()
+
+    def _watch(self, read_stream, task_group):
+        # Relay the transport's messages so the session notices when the server goes away
+        # (process exited, SSE stream dropped) even while nobody is calling it
+        send, receive = anyio.create_memory_object_stream(0)
+
+        async def relay():
+            try:
+                async with send:
+                    async for message in read_stream:
+                        await send.send(message)
+            except _TRANSPORT_ERRORS:
+                pass
+            finally:
+                self._lost.set()
+
+        task_group.start_soon(relay)
+        return receive
+
+    async def _serve(self, client, server_name: str):
+        self._client = client
+        self.server_name = server_name
+        logger.info(f"Connected to {server_name} ({self.server_type})")
+        self._ready.set()
+        closing = asyncio.ensure_future(self._closing.wait())
+        lost = asyncio.ensure_future(self._lost.wait())
+        try:
+            await asyncio.wait((closing, lost), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closing.cancel()
+            lost.cancel()
+        self.broken = True
+        if not self._closing.is_set():
+            logger.warning(f"MCP transport to {self.params} closed")
+
+    async def _request(self, request):
+        self.last_used = time.monotonic()
+        try:
+            return await asyncio.wait_for(request, timeout=self.call_timeout)
+        except asyncio.TimeoutError:
+            # the reply may still arrive later and confuse the next caller, don't reuse the session
+            self.broken = True
+            raise TimeoutError(f"No reply from {self.params} within {self.call_timeout}s") from None
+        except _TRANSPORT_ERRORS:
+            self.broken = True
+            raise
+        except McpError as e:
+            if e.error.code == CONNECTION_CLOSED:
+                self.broken = True
+            raise
+
+    async def list_tools(self) -> list:
+        tools = await self._request(self._client.list_tools())
+        # ClientSession returns a ListToolsResult, fastmcp Client a plain list
+        return tools if isinstance(tools, list) else tools.tools
+
+    async def call_tool(self, name: str, arguments: dict):
+        return await self._request(self._client.call_tool(name, arguments=arguments))
+
+    async def ping(self):
+        if isinstance(self._client, ClientSession):
+            await self._client.send_ping()
+        else:
+            await self._client.ping()
+        self.last_used = time.monotonic()
+
+    async def close(self):
+        self.broken = True
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+class _ServerSlot:
+    def __init__(self, max_sessions: int):
+        self.idle: List[PooledSession] = []
+        self.in_use = 0
+        self.limit = asyncio.Semaphore(max_sessions)
+
+
+class MCPSessionPool:
+    """
+    Keeps initialized MCP sessions alive per server (keyed by ToolMap.params) and
+    hands them out to callers, so a tool call does not pay for a fresh transport,
+    process spawn and initialize handshake every time.
+    """
+
+    def __init__(self, max_sessions_per_server: int = 4, idle_timeout: float = 300.0,
+                 health_check_after: float = 30.0, connect_timeout: float = 30.0, call_timeout: float = 60.0):
+        self.max_sessions_per_server = max_sessions_per_server
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.call_timeout = call_timeout
+        self.message_handler: Optional[Callable] = None
+        self._slots: Dict[str, _ServerSlot] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def _slot(self, key: str) -> _ServerSlot:
+        if key not in self._slots:
+            self._slots[key] = _ServerSlot(self.max_sessions_per_server)
+        return self._slots[key]
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._evict_idle())
+
+    async def _evict_idle(self):
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 4, 1))
+            now = time.monotonic()
+            # close() awaits, so checkouts can take sessions or add servers while this runs
+            for slot in list(self._slots.values()):
+                expired = [s for s in slot.idle if now - s.last_used > self.idle_timeout]
+                for session in expired:
+                    if session not in slot.idle:
+                        continue
+                    slot.idle.remove(session)
+                    logger.info(f"Evicting idle MCP session to {session.params}")
+                    await session.close()
+
+    async def _checkout(self, server_type: str, params, connect_timeout: Optional[float] = None) -> PooledSession:
+        connect_timeout = min(self.connect_timeout, connect_timeout or self.connect_timeout)
+        slot = self._slot(pool_key(server_type, params))
+        while slot.idle:
+            session = slot.idle.pop()
+            if session.broken:
+                await session.close()
+                continue
+            if time.monotonic() - session.last_used > self.health_check_after:
+                try:
+                    await asyncio.wait_for(session.ping(), timeout=connect_timeout)
+                except Exception as e:
+                    logger.warning(f"Health check failed for {params}, reconnecting: {e}")
+                    await session.close()
+                    continue
+            return session
+        session = PooledSession(server_type, params, message_handler=self.message_handler,
+                                call_timeout=self.call_timeout)
+        await session.open(timeout=connect_timeout)
+        return session
+
+    def _checkin(self, server_type: str, params, session: PooledSession):
+        slot = self._slot(pool_key(server_type, params))
+        if session.broken:
+            asyncio.create_task(session.close())
+        else:
+            slot.idle.append(session)
+
+    async def run(self, server_type: str, params, operation: Callable, retries: int = 1,
+                  connect_timeout: Optional[float] = None):
+        """
+        Run `operation(session)` on a pooled session. If the session's transport dies
+        mid-call it is discarded and the operation is retried on a fresh connection.
+        `connect_timeout` can only tighten the pool's own connect timeout.
+        """
+        self._ensure_reaper()
+        slot = self._slot(pool_key(server_type, params))
+        async with slot.limit:
+            slot.in_use += 1
+            try:
+                for attempt in range(retries + 1):
+                    session = await self._checkout(server_type, params, connect_timeout)
+                    try:
+                        result = await operation(session)
+                    except asyncio.CancelledError:
+                        # the request may still be in flight, don't hand this session out again
+                        session.broken = True
+                        self._checkin(server_type, params, session)
+                        raise
+                    except Exception as e:
+                        # tool errors leave a healthy session, only a dead transport is retried;
+                        # a call that timed out may still be running, so it is not sent again
+                        self._checkin(server_type, params, session)
+                        if not session.broken or isinstance(e, TimeoutError) or attempt == retries:
+                            raise
+                        logger.warning(f"MCP session to {params} dropped, reconnecting: {e}")
+                        continue
+                    self._checkin(server_type, params, session)
+                    return result
+            finally:
+                slot.in_use -= 1
+
+    async def call_tool(self, server_type: str, params, name: str, arguments: dict):
+        return await self.run(server_type, params, lambda session: session.call_tool(name, arguments))
+
+    async def list_tools(self, server_type: str, params, connect_timeout: Optional[float] = None):
+        async def _list(session: PooledSession):
+            return session.server_name, await session.list_tools()
+        return await self.run(server_type, params, _list, connect_timeout=connect_timeout)
+
+    def stats(self) -> dict:
+        return {key: {"idle": len(slot.idle), "in_use": slot.in_use} for key, slot in self._slots.items()}
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for slot in self._slots.values():
+            while slot.idle:
+                await slot.idle.pop().close()
@@ -1,73 +1,157 @@
+import json
 import queue
+import uuid
 import streamlit as st
 from websocket import create_connection, WebSocketException
 import threading
 import time
 
+# How often the chat fragment re-renders while a reply is still on its way
+POLL_INTERVAL_S = 0.2
+
 st.title("WebSocket Chat App")
 
+
+class ChatConnection:
+    """
+    Owns the websocket in a background thread. Received frames go to `messages`;
+    a dropped connection is reopened with exponential backoff.
+    """
+
+    def __init__(self, url: str, min_backoff: float = 0.5, max_backoff: float = 10.0):
+        self.url = url
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.messages = queue.Queue()
+        self.status = "connecting"
+        self.closed = False
+        self._ws = None
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        backoff = self.min_backoff
+        while not self.closed:
+            try:
+                ws = create_connection(self.url, ping_interval=20, ping_timeout=10)
+            except Exception as e:
+                self.status = f"reconnecting in {backoff:.1f}s ({e})"
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            with self._lock:
+                self._ws = ws
+            self.status = "connected"
+            backoff = self.min_backoff
+            try:
+                while True:
+                    message = ws.recv()
+                    if not message:
+                        # Empty read means the server closed the connection
+                        break
+                    self.messages.put(message)
+            except (WebSocketException, OSError):
+                pass
+            with self._lock:
+                self._ws = None
+            if not self.closed:
+                self.status = "reconnecting"
+                # Requests sent on the old connection will never be answered
+                self.messages.put(json.dumps({"type": "disconnected"}))
+
+    def send(self, text: str) -> bool:
+        with self._lock:
+            if self._ws is None:
+                return False
+            try:
+                self._ws.send(text)
+                return True
+            except (WebSocketException, OSError):
+                return False
+
+    def close(self):
+        self.closed = True
+        with self._lock:
+            if self._ws is not None:
+                self._ws.close()
+
+
 # Initialize session state
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
-if 'message_queue' not in st.session_state:
-    st.session_state.message_queue = queue.Queue()
+# Replies still being streamed in, by request id
+if 'pending' not in st.session_state:
+    st.session_state.pending = {}
 
 # WebSocket URL input
-ws_url = st.text_input("WebSocket URL", "ws://localhost:8200/chat")
+ws_url = st.text_input("WebSocket URL", "ws://localhost:8200/chat?stream=1")
 
-# Establish connection once
-if 'ws' not in st.session_state:
-    try:
-        ws = create_connection(ws_url, ping_interval=20, ping_timeout=10)
-        st.session_state.ws = ws
-    except Exception as e:
-        st.error(f"Connection error: {e}")
-
-# Function to continuously receive messages
-def receive_messages(ws, msg_queue):
-    if not ws:
-        return
-    while True:
-        try:
-            message = ws.recv()
-            msg_queue.put(message)
-        except WebSocketException:
-            break
-
-# Start listener thread once
-if 'listener_started' not in st.session_state and st.session_state.get('ws'):
-    threading.Thread(target=receive_messages, args=(st.session_state.ws, st.session_state.message_queue), daemon=True).start()
-    st.session_state.listener_started = True
+# Open the connection once, and again only if the URL changes
+connection = st.session_state.get('connection')
+if connection is None or connection.url != ws_url:
+    if connection is not None:
+        connection.close()
+    connection = st.session_state.connection = ChatConnection(ws_url)
 
 # Message input and send button
 message = st.text_input("Your message", key="message_input")
-if st.button("Send"):
-    ws = st.session_state.get('ws')
-    if ws:
-        try:
-            ws.send(message)
-            st.session_state.messages.append(f"You: {message}")
-        except WebSocketException:
-            st.error("Failed to send message. Connection may be closed.")
-
-# Display chat history
-chat_placeholder = st.empty()
-
-# Update chat history
-def update_chat():
-    while not st.session_state.message_queue.empty():
-        new_message = st.session_state.message_queue.get()
+if st.button("Send") and message:
+    request_id = uuid.uuid4().hex[:8]
+    if connection.send(json.dumps({"type": "query", "id": request_id, "text": message})):
+        st.session_state.messages.append(f"You: {message}")
+        st.session_state.pending[request_id] = {"text": "", "progress": ""}
+    else:
+        st.error(f"Not connected ({connection.status}), please try again in a moment.")
+
+
+def handle_message(new_message):
+    try:
+        frame = json.loads(new_message)
+    except ValueError:
+        frame = None
+    pending = st.session_state.pending
+    if not isinstance(frame, dict) or "type" not in frame:
+        # Plain text frame from an older server
         st.session_state.messages.append(new_message)
+    elif frame["type"] == "disconnected":
+        for request_id in list(pending):
+            st.session_state.messages.append("Agent: (connection lost before the reply arrived, please ask again)")
+            del pending[request_id]
+    elif frame.get("id") not in pending:
+        return
+    elif frame["type"] == "token":
+        pending[frame["id"]]["text"] += frame["text"]
+    elif frame["type"] == "progress":
+        state = "running" if frame["event"] == "tool_started" else "finished"
+        pending[frame["id"]]["progress"] = f"{frame['tool']} {state}"
+    elif frame["type"] in ("end", "error", "cancelled"):
+        text = frame.get("text") or frame["type"]
+        st.session_state.messages.append(text if text.startswith("Agent:") else f"Agent: {text}")
+        del pending[frame["id"]]
+
+
+# Only re-run on a timer while a reply is outstanding; an idle tab does no work
+@st.fragment(run_every=POLL_INTERVAL_S if st.session_state.pending else None)
+def chat_history():
+    was_waiting = bool(st.session_state.pending)
+    while not connection.messages.empty():
+        handle_message(connection.messages.get())
+
+    if connection.status != "connected":
+        st.caption(f"Connection: {connection.status}")
+    st.write("### Chat History")
+    for msg in st.session_state.messages:
+        st.write(msg)
+    for reply in st.session_state.pending.values():
+        if reply["text"]:
+            st.write(f"Agent: {reply['text']}▌")
+        else:
+            st.write(f"Agent: _{reply['progress'] or 'thinking'}…_")
 
-    with chat_placeholder.container():
-        st.write("### Chat History")
-        for msg in st.session_state.messages:
-            st.write(msg)
+    if was_waiting and not st.session_state.pending:
+        # Everything answered, re-run the page once so the fragment stops its timer
+        st.rerun()
 
-# Call it initially
-update_chat()
 
-# Auto-refresh chat every 2 seconds
-time.sleep(2)
-st.rerun()
+chat_history()
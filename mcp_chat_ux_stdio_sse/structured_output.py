@@ -0,0 +1,101 @@
+import ast
+import json
+import re
+from typing import Dict, List
+
+from loguru import logger
+
+
+class LLMOutputError(ValueError):
+    pass
+
+
+class ParseStats:
+    def __init__(self):
+        self.parsed = 0
+        self.repaired = 0
+        self.parse_failures = 0
+        self.retries = 0
+        self.gave_up = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+parse_stats = ParseStats()
+
+_FENCE = re.compile(r"^```(?:json|python)?\s*|\s*```$", re.I)
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+
+
+def tool_selection_schema(tool_names: List[str]) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "tool": {"type": "string", "enum": tool_names},
+            "arguments": {"type": "object"},
+        },
+        "required": ["tool", "arguments"],
+    }
+
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ["respond_to_user", ""]},
+        "response": {"type": "string"},
+    },
+    "required": ["action", "response"],
+}
+
+
+def tool_definitions(tools: list) -> List[dict]:
+    # MCP tools -> function schemas for the backend's native `tools` parameter
+    return [
+        {
+            "type": "function",
+            "function": {"name": tool.name, "description": tool.description or "", "parameters": tool.inputSchema},
+        }
+        for tool in tools
+    ]
+
+
+def parse_llm_json(text: str, required: List[str]) -> Dict:
+    """
+    Parse a model reply into a dict. Strict JSON is tried first, then cheap repairs
+    (code fences, surrounding prose, trailing commas, Python dict quoting).
+    """
+    try:
+        result = json.loads(text)
+    except (TypeError, ValueError):
+        result = _repair(text or "")
+        parse_stats.repaired += 1
+    if not isinstance(result, dict):
+        raise LLMOutputError(f"expected a JSON object, got {type(result).__name__}")
+    missing = [key for key in required if key not in result]
+    if missing:
+        raise LLMOutputError(f"missing keys {missing}")
+    parse_stats.parsed += 1
+    return result
+
+
+def _repair(text: str):
+    candidate = _FENCE.sub("", text.strip())
+    start, end = candidate.find("{"), candidate.rfind("}")
+    if start == -1 or end < start:
+        raise LLMOutputError("no JSON object found in the reply")
+    candidate = _TRAILING_COMMA.sub(r'\1', candidate[start:end + 1])
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError) as e:
+        raise LLMOutputError(f"reply is not valid JSON: {e}") from None
+
+
+def repair_prompt(message: str, error: Exception) -> str:
+    logger.warning(f"Could not parse LLM reply, asking again: {error}")
+    return (f"{message}\n\nYour previous reply could not be parsed ({error}). "
+            "Reply again with ONLY the JSON object in the required format, no other text.")
@@ -0,0 +1,186 @@
+import json
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_MISSING = object()
+# "1,250,000" or "1,250.5": commas as thousands separators only, never a decimal comma
+_THOUSANDS = re.compile(r"[+-]?\d{1,3}(,\d{3})+(\.\d+)?")
+
+
+class ValidationStats:
+    def __init__(self):
+        self.validated = 0
+        self.coerced = 0
+        self.rejected = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+validation_stats = ValidationStats()
+
+
+class ArgumentError(ValueError):
+    pass
+
+
+def _coerce_number(value, integer: bool):
+    if isinstance(value, bool):
+        raise ArgumentError("expected a number, got a boolean")
+    if isinstance(value, str):
+        text = value.strip()
+        if _THOUSANDS.fullmatch(text):
+            text = text.replace(",", "")
+        try:
+            value = float(text)
+        except ValueError:
+            raise ArgumentError(f"expected a number, got {value!r}") from None
+    if not isinstance(value, (int, float)):
+        raise ArgumentError(f"expected a number, got {type(value).__name__}")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ArgumentError(f"expected a finite number, got {value!r}")
+    if integer:
+        if isinstance(value, float) and not value.is_integer():
+            raise ArgumentError(f"expected an integer, got {value!r}")
+        return int(value)
+    return value
+
+
+def _coerce_boolean(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "yes", "1", "false", "no", "0"):
+        return value.strip().lower() in ("true", "yes", "1")
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    raise ArgumentError(f"expected a boolean, got {value!r}")
+
+
+def _coerce_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ArgumentError(f"expected a string, got {type(value).__name__}")
+
+
+def _parse_container(value, expected: type):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            if expected is list:
+                # "Dubai, Mumbai" -> ["Dubai", "Mumbai"]
+                return [item.strip() for item in value.split(",") if item.strip()]
+            raise ArgumentError(f"expected an object, got {value!r}") from None
+    if not isinstance(value, expected):
+        raise ArgumentError(f"expected {'an array' if expected is list else 'an object'}, got {type(value).__name__}")
+    return value
+
+
+def _compile(schema: dict) -> Callable[[Any], Any]:
+    """Turn a JSON schema fragment into a coerce-or-raise function."""
+    if "anyOf" in schema or "oneOf" in schema:
+        options = [_compile(option) for option in schema.get("anyOf", schema.get("oneOf"))]
+
+        def any_of(value):
+            errors = []
+            for option in options:
+                try:
+                    return option(value)
+                except ArgumentError as e:
+                    errors.append(str(e))
+            raise ArgumentError(" or ".join(errors))
+        return any_of
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        return _compile({"anyOf": [{**schema, "type": option} for option in schema_type]})
+
+    if schema_type == "object" or "properties" in schema:
+        return _compile_object(schema)
+    if schema_type in ("number", "integer"):
+        check = lambda value: _coerce_number(value, integer=schema_type == "integer")
+    elif schema_type == "boolean":
+        check = _coerce_boolean
+    elif schema_type == "string":
+        check = _coerce_string
+    elif schema_type == "null":
+        def check(value):
+            if value is None or (isinstance(value, str) and value.strip().lower() in ("", "null", "none")):
+                return None
+            raise ArgumentError(f"expected null, got {value!r}")
+    elif schema_type == "array":
+        items = _compile(schema.get("items", {}))
+
+        def check(value):
+            return [items(item) for item in _parse_container(value, list)]
+    else:
+        check = lambda value: value
+
+    enum = schema.get("enum")
+    if enum is None:
+        return check
+
+    def check_enum(value):
+        value = check(value)
+        if value not in enum:
+            raise ArgumentError(f"expected one of {enum}, got {value!r}")
+        return value
+    return check_enum
+
+
+def _compile_object(schema: dict) -> Callable[[Any], Dict]:
+    properties = {name: _compile(prop) for name, prop in schema.get("properties", {}).items()}
+    defaults = {name: prop["default"] for name, prop in schema.get("properties", {}).items() if "default" in prop}
+    required = schema.get("required", [])
+    allow_extra = schema.get("additionalProperties", True) is not False
+
+    def check(value):
+        value = _parse_container(value, dict)
+        errors: List[str] = []
+        result = {}
+        for name, coerce in properties.items():
+            raw = value.get(name, _MISSING)
+            if raw is _MISSING:
+                if name in required:
+                    errors.append(f"'{name}' is required")
+                elif name in defaults:
+                    result[name] = defaults[name]
+                continue
+            try:
+                result[name] = coerce(raw)
+            except ArgumentError as e:
+                errors.append(f"'{name}': {e}")
+        for name, raw in value.items():
+            if name not in properties:
+                if allow_extra:
+                    result[name] = raw
+                else:
+                    errors.append(f"unexpected argument '{name}'")
+        if errors:
+            raise ArgumentError("; ".join(errors))
+        return result
+    return check
+
+
+class ArgumentValidator:
+    """
+    Validates and type-coerces a tool call's arguments against the tool's
+    inputSchema before it is dispatched, e.g. {"weight_kg": "70"} -> {"weight_kg": 70.0}.
+    """
+
+    def __init__(self, schema: Optional[dict]):
+        self._check = _compile_object(schema or {"type": "object"})
+
+    def __call__(self, arguments) -> Tuple[Optional[Dict], Optional[str]]:
+        validation_stats.validated += 1
+        try:
+            coerced = self._check(arguments if arguments is not None else {})
+        except ArgumentError as e:
+            validation_stats.rejected += 1
+            return None, str(e)
+        if coerced != arguments:
+            validation_stats.coerced += 1
+        return coerced, None
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from mcp.types import ServerNotification, ToolListChangedNotification
+
+from structured_output import tool_definitions, tool_selection_schema
+from tool_arguments import ArgumentValidator
+from tool_retrieval import ToolRetrievalIndex
+
+
+class ToolNotFoundError(KeyError):
+    pass
+
+
+class ToolRoute:
+    def __init__(self, name: str, tool_name: str, tool, tool_map):
+        # name is what the model sees, tool_name is what the owning server expects
+        self.name = name
+        self.tool_name = tool_name
+        self.tool = tool
+        self.tool_map = tool_map
+        self.server_type = tool_map.server_type
+        self.params = tool_map.params
+        self.schema = tool.inputSchema
+        self.validator = ArgumentValidator(tool.inputSchema)
+
+
+class ToolRouter:
+    """
+    Tool name -> owning server index, built once per catalog version. Tool names
+    offered by more than one server are namespaced as "<server>__<tool>", which
+    stays within the ^[a-zA-Z0-9_-]{1,64}$ function names OpenAI accepts.
+    """
+
+    def __init__(self, tool_context: list):
+        self.routes: Dict[str, ToolRoute] = {}
+        self.tools: list = []
+        owners = Counter(tool.name for tool_map in tool_context
+                         for tools in tool_map.tool.values() for tool in tools)
+        for tool_map in tool_context:
+            for server_name, tools in tool_map.tool.items():
+                for tool in tools:
+                    name = tool_name = tool.name
+                    if owners[name] > 1:
+                        prefix = re.sub(r'[^A-Za-z0-9_-]+', '_', server_name)
+                        name = f"{prefix[:max(62 - len(tool.name), 1)]}__{tool.name}"
+                        if name in self.routes:
+                            name = f"{name}_{len(self.routes)}"
+                        tool = tool.model_copy(update={"name": name})
+                    self.routes[name] = ToolRoute(name, tool_name, tool, tool_map)
+                    self.tools.append(tool)
+        # Backend-ready schemas for structured tool selection
+        self.tool_definitions = tool_definitions(self.tools)
+        self.selection_schema = tool_selection_schema(list(self.routes))
+        self.retrieval = ToolRetrievalIndex(self.tools)
+        duplicates = [name for name, count in owners.items() if count > 1]
+        if duplicates:
+            logger.warning(f"Tools offered by several servers were namespaced: {duplicates}")
+
+    def select(self, query: str, k: int, min_score: float) -> Tuple[list, dict]:
+        """Tools worth offering the model for `query`, with their backend schemas."""
+        tools = self.retrieval.top_k(query, k=k, min_score=min_score)
+        if len(tools) == len(self.tools):
+            return self.tools, {"tools": self.tool_definitions, "format": self.selection_schema}
+        return tools, {"tools": tool_definitions(tools), "format": tool_selection_schema([tool.name for tool in tools])}
+
+    def resolve(self, name: str) -> ToolRoute:
+        try:
+            return self.routes[name]
+        except KeyError:
+            raise ToolNotFoundError(name) from None
+
+
+class CatalogSnapshot:
+    """Immutable view of the discovered tools, shared by every websocket session."""
+
+    def __init__(self, version: int, tool_context: list, fingerprint: str, router: Optional[ToolRouter] = None):
+        self.version = version
+        self.tool_context = tool_context
+        self.fingerprint = fingerprint
+        self.router = router or ToolRouter(tool_context)
+        self.refreshed_at = time.time()
+        self._refreshed_monotonic = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self._refreshed_monotonic
+
+
+def catalog_fingerprint(tool_context: list) -> str:
+    entries = []
+    for tool_map in tool_context:
+        for server_name, tools in tool_map.tool.items():
+            for tool in tools:
+                entries.append([tool_map.server_type, server_name, tool.name, tool.description, tool.inputSchema])
+    return hashlib.sha256(json.dumps(entries, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ToolCatalog:
+    """
+    Process-wide tool catalog. Readers get the current snapshot without waiting,
+    while refreshes run in the background when the TTL expires or a server sends
+    notifications/tools/list_changed. The version only moves when the tools change.
+    A server that fails a refresh keeps its last known tools and is retried after
+    `retry_after` instead of the full TTL.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Optional[list]]], ttl: float = 300.0,
+                 retry_after: float = 30.0):
+        self.loader = loader
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background: Optional[asyncio.Task] = None
+        self._stale = False
+
+    async def snapshot(self) -> CatalogSnapshot:
+        if self._snapshot is None:
+            # Only the very first reader has to wait, concurrent ones share the same build;
+            # shielded so one reader being cancelled doesn't cancel it for the others
+            await asyncio.shield(self.refresh())
+        elif self._stale or self._snapshot.age > self.ttl:
+            self.refresh()
+        return self._snapshot
+
+    def refresh(self) -> "asyncio.Task":
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._rebuild())
+        return self._refresh_task
+
+    async def _rebuild(self):
+        self._stale = False
+        try:
+            tool_context: Optional[List] = await self.loader()
+        except Exception as e:
+            logger.error(f"Error loading tool catalog: {str(e)}")
+            tool_context = None
+        if tool_context is None:
+            logger.error("Tool catalog refresh failed, keeping the previous snapshot")
+            if self._snapshot is None:
+                self._snapshot = CatalogSnapshot(version=0, tool_context=[], fingerprint="")
+            return
+        tool_context = self._keep_last_known_tools(tool_context)
+        fingerprint = catalog_fingerprint(tool_context)
+        if self._snapshot is not None and fingerprint == self._snapshot.fingerprint:
+            # Same tools, keep the version and everything derived from it
+            self._snapshot = CatalogSnapshot(version=self._snapshot.version, tool_context=tool_context,
+                                             fingerprint=fingerprint, router=self._snapshot.router)
+            return
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        logger.info(f"Tool catalog updated to version {version}")
+        self._snapshot = CatalogSnapshot(version=version, tool_context=tool_context, fingerprint=fingerprint)
+
+    def _keep_last_known_tools(self, tool_context: list) -> list:
+        # A server that is briefly unreachable keeps its tools (still marked unavailable),
+        # rather than disappearing from the catalog until the next refresh
+        if self._snapshot is None:
+            return tool_context
+        last_known = {(tool_map.server_type, str(tool_map.params)): tool_map.tool
+                      for tool_map in self._snapshot.tool_context if tool_map.tool}
+        merged = []
+        for tool_map in tool_context:
+            tools = last_known.get((tool_map.server_type, str(tool_map.params)))
+            if not tool_map.available and not tool_map.tool and tools:
+                tool_map = tool_map.model_copy(update={"tool": tools})
+            merged.append(tool_map)
+        return merged
+
+    def invalidate(self):
+        self._stale = True
+        self.refresh()
+
+    async def handle_message(self, message):
+        # Passed to MCP sessions as their message_handler
+        if isinstance(message, ServerNotification) and isinstance(message.root, ToolListChangedNotification):
+            logger.info("Received tools/list_changed, refreshing tool catalog")
+            self.invalidate()
+
+    def start(self):
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self._refresh_periodically())
+
+    async def _refresh_periodically(self):
+        while True:
+            await self.refresh()
+            unavailable = self._snapshot is not None and any(
+                not tool_map.available for tool_map in self._snapshot.tool_context)
+            await asyncio.sleep(min(self.retry_after, self.ttl) if unavailable else self.ttl)
+
+    async def stop(self):
+        for task in (self._background, self._refresh_task):
+            if task is not None:
+                task.cancel()
+
+    def info(self) -> dict:
+        if self._snapshot is None:
+            return {"version": None, "age_seconds": None, "refreshed_at": None, "servers": []}
+        return {
+            "version": self._snapshot.version,
+            "age_seconds": round(self._snapshot.age, 3),
+            "refreshed_at": self._snapshot.refreshed_at,
+            "servers": [
+                {
+                    "server_type": tool_map.server_type,
+                    "params": str(tool_map.params),
+                    "available": tool_map.available,
+                    "error": tool_map.error,
+                    "tools": [tool.name for tools in tool_map.tool.values() for tool in tools],
+                }
+                for tool_map in self._snapshot.tool_context
+            ],
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, List
+
+from loguru import logger
+
+# "{{s1}}" inside a step's arguments is replaced with the text result of step s1
+_PLACEHOLDER = re.compile(r"\{\{\s*([\w.-]+)\s*\}\}")
+
+
+class PlanError(ValueError):
+    pass
+
+
+class PlanStats:
+    def __init__(self):
+        self.plans = 0
+        self.steps = 0
+        self.waves = 0
+        self.failed_steps = 0
+        self.fallbacks = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+plan_stats = PlanStats()
+
+
+def plan_schema(tool_names: List[str]) -> dict:
+    return {
+        "type": "object",
+        "properties": {
+            "steps": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "string"},
+                        "tool": {"type": "string", "enum": tool_names},
+                        "arguments": {"type": "object"},
+                        "depends_on": {"type": "array", "items": {"type": "string"}},
+                    },
+                    "required": ["id", "tool", "arguments"],
+                },
+            },
+        },
+        "required": ["steps"],
+    }
+
+
+class PlanStep:
+    def __init__(self, id: str, tool: str, arguments: dict, depends_on: List[str]):
+        self.id = id
+        self.tool = tool
+        self.arguments = arguments
+        self.depends_on = depends_on
+
+    def __repr__(self):
+        return f"PlanStep({self.id}, {self.tool}, {self.arguments}, depends_on={self.depends_on})"
+
+
+class ToolPlan:
+    """
+    A small dependency graph of tool calls returned by the model in one generation.
+    Steps are grouped into waves; every step of a wave only depends on earlier waves,
+    so a whole wave can be dispatched at once.
+    """
+
+    def __init__(self, steps: List[PlanStep]):
+        self.steps = steps
+        self.waves = self._layer(steps)
+
+    @classmethod
+    def from_reply(cls, reply: dict, max_steps: int) -> "ToolPlan":
+        raw_steps = reply.get("steps")
+        if not isinstance(raw_steps, list):
+            raise PlanError("'steps' must be a list")
+        if len(raw_steps) > max_steps:
+            raise PlanError(f"plan has {len(raw_steps)} steps, at most {max_steps} are allowed")
+        steps = []
+        for i, raw in enumerate(raw_steps):
+            if not isinstance(raw, dict) or "tool" not in raw:
+                raise PlanError(f"step {i} has no tool")
+            arguments = raw.get("arguments") or {}
+            depends_on = raw.get("depends_on") or []
+            if not isinstance(arguments, dict) or not isinstance(depends_on, list):
+                raise PlanError(f"step {i} has malformed arguments or depends_on")
+            steps.append(PlanStep(id=str(raw.get("id") or f"s{i + 1}"), tool=str(raw["tool"]),
+                                  arguments=arguments, depends_on=[str(dep) for dep in depends_on]))
+        return cls(steps)
+
+    @staticmethod
+    def _layer(steps: List[PlanStep]) -> List[List[PlanStep]]:
+        ids = [step.id for step in steps]
+        if len(set(ids)) != len(ids):
+            raise PlanError(f"duplicate step ids in {ids}")
+        for step in steps:
+            unknown = [dep for dep in step.depends_on if dep not in ids]
+            if unknown:
+                raise PlanError(f"step {step.id} depends on unknown steps {unknown}")
+        waves, done, remaining = [], set(), list(steps)
+        while remaining:
+            wave = [step for step in remaining if all(dep in done for dep in step.depends_on)]
+            if not wave:
+                raise PlanError(f"dependency cycle between steps {[step.id for step in remaining]}")
+            waves.append(wave)
+            done.update(step.id for step in wave)
+            remaining = [step for step in remaining if step.id not in done]
+        return waves
+
+
+def substitute(value, results: Dict[str, str]):
+    if isinstance(value, dict):
+        return {key: substitute(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, results) for item in value]
+    if isinstance(value, str):
+        return _PLACEHOLDER.sub(lambda m: results.get(m.group(1), m.group(0)), value)
+    return value
+
+
+async def execute_plan(plan: ToolPlan, run_step: Callable[[PlanStep, dict], Awaitable[str]]) -> List[dict]:
+    """
+    Run the plan wave by wave with `run_step(step, arguments)`. Results and errors are
+    collected per step; a step whose dependency failed is skipped rather than called
+    with a half-filled argument.
+    """
+    plan_stats.plans += 1
+    plan_stats.waves += len(plan.waves)
+    results: Dict[str, str] = {}
+    failed = set()
+    outcomes = []
+    for wave in plan.waves:
+        runnable, calls = [], []
+        for step in wave:
+            if any(dep in failed for dep in step.depends_on):
+                failed.add(step.id)
+                outcomes.append({"id": step.id, "tool": step.tool, "error": "skipped, a step it depends on failed"})
+                continue
+            runnable.append(step)
+            calls.append(run_step(step, substitute(step.arguments, results)))
+        for step, result in zip(runnable, await asyncio.gather(*calls, return_exceptions=True)):
+            plan_stats.steps += 1
+            if isinstance(result, BaseException):
+                plan_stats.failed_steps += 1
+                failed.add(step.id)
+                logger.warning(f"Plan step {step.id} ({step.tool}) failed: {result}")
+                outcomes.append({"id": step.id, "tool": step.tool, "error": str(result)})
+            else:
+                results[step.id] = result
+                outcomes.append({"id": step.id, "tool": step.tool, "result": result})
+    return outcomes
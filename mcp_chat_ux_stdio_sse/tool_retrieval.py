@@ -0,0 +1,77 @@
+import math
+import re
+from collections import Counter
+from typing import List, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_STOPWORDS = {"a", "an", "the", "is", "in", "of", "for", "to", "and", "or", "what", "whats", "s", "me", "my",
+              "i", "it", "on", "at", "given", "like", "etc", "if", "no", "be", "by", "with", "this", "that"}
+
+
+def tokenize(text: str) -> List[str]:
+    # TimeTool / weather_tool / weight_kg -> time tool / weather tool / weight kg
+    text = _CAMEL.sub(" ", text or "").replace("_", " ").lower()
+    tokens = []
+    for token in _TOKEN.findall(text):
+        if token in _STOPWORDS or token.isdigit():
+            continue
+        tokens.append(token)
+        # crude stemming so "temperatures" matches "temperature"
+        if len(token) > 4 and token.endswith("s"):
+            tokens.append(token[:-1])
+    return tokens
+
+
+def tool_document(tool) -> List[str]:
+    schema = tool.inputSchema or {}
+    parameters = " ".join(
+        f"{name} {prop.get('title', '')} {prop.get('description', '')}"
+        for name, prop in schema.get("properties", {}).items()
+    )
+    # The name counts twice, it is the strongest signal
+    return tokenize(f"{tool.name} {tool.name} {tool.description or ''} {parameters}")
+
+
+class ToolRetrievalIndex:
+    """
+    BM25 index over tool names, descriptions and parameter names, built with the
+    catalog so the tool-selection prompt only carries the tools relevant to a query.
+    """
+
+    def __init__(self, tools: list, k1: float = 1.2, b: float = 0.75):
+        self.tools = tools
+        self.k1 = k1
+        self.b = b
+        self._docs = [Counter(tool_document(tool)) for tool in tools]
+        self._lengths = [sum(doc.values()) for doc in self._docs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter(term for doc in self._docs for term in doc)
+        n = len(self._docs)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def score(self, query: str) -> List[Tuple[float, int]]:
+        terms = set(tokenize(query))
+        scores = []
+        for i, doc in enumerate(self._docs):
+            score = 0.0
+            for term in terms:
+                tf = doc.get(term)
+                if not tf:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1))
+                score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append((score, i))
+        return sorted(scores, key=lambda item: item[0], reverse=True)
+
+    def top_k(self, query: str, k: int, min_score: float = 0.5) -> list:
+        """
+        The k best matching tools, or the whole catalog when the match is weak
+        (best score under `min_score`), so retrieval never hides the right tool.
+        """
+        if k <= 0 or len(self.tools) <= k:
+            return self.tools
+        ranked = self.score(query)
+        if not ranked or ranked[0][0] < min_score:
+            return self.tools
+        return [self.tools[i] for score, i in ranked[:k] if score > 0]
@@ -0,0 +1,49 @@
+import time
+
+
+class TurnAborted(Exception):
+    pass
+
+
+class TurnStats:
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.steps = 0
+        self.step_budget_exceeded = 0
+        self.deadline_exceeded = 0
+        self.cancelled_on_disconnect = 0
+        self.cancelled_by_client = 0
+        self.failed = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+turn_stats = TurnStats()
+
+
+class TurnBudget:
+    """
+    Limits one user turn of the agent loop to `max_steps` tool steps. The wall-clock
+    deadline is enforced by the caller with asyncio.timeout, so in-flight LLM and tool
+    calls are cancelled when it passes.
+    """
+
+    def __init__(self, max_steps: int, deadline: float):
+        self.max_steps = max_steps
+        self.deadline = deadline
+        self.steps = 0
+        self.started_at = time.monotonic()
+        turn_stats.started += 1
+
+    def step(self):
+        if self.steps >= self.max_steps:
+            turn_stats.step_budget_exceeded += 1
+            raise TurnAborted(f"step budget of {self.max_steps} exhausted")
+        self.steps += 1
+        turn_stats.steps += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
@@ -1,39 +1,90 @@
 import datetime
 import os
-from zoneinfo import ZoneInfo
-import requests
+import sys
+from contextlib import asynccontextmanager
+from starlette.responses import JSONResponse
 
 from mcp.server.fastmcp import FastMCP
 
+# weather, timezone and worker-pool code lives in mcp_shared/ at the repo root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from mcp_shared.weather_client import weather_client_from_env
+from mcp_shared.timezone_index import get_zoneinfo, timezone_index
+from mcp_shared.tool_executor import tool_executor_from_env
+
 
 mcp = FastMCP("MCP Server Streaming HTTP", host="0.0.0.0", port=8100)
+# One pooled HTTP client for the weather API, shared by every session
+weather_client = weather_client_from_env()
+# Sync tools run on a bounded worker pool so they never block the event loop
+tool_executor = tool_executor_from_env()
 
 @mcp.tool()
+@tool_executor.offload("io")
 def TimeTool(input_timezone):
-    "Provides the current time for a given city's timezone like Asia/Kolkata, America/New_York etc. If no timezone is provided, it returns the local time."
+    "Provides the current time for a given city's timezone like Asia/Kolkata, America/New_York etc. City or country names like Bengaluru or Japan work too. If no timezone is provided, it returns the local time."
     format = "%Y-%m-%d %H:%M:%S %Z%z"
     current_time = datetime.datetime.now()    
     if input_timezone:
         print("TimeZone", input_timezone)
-        current_time =  current_time.astimezone(ZoneInfo(input_timezone))
+        # City names and typos resolve locally instead of failing the call
+        zone = timezone_index.zone(input_timezone)
+        if zone is None:
+            return f"Sorry, I couldn't find a timezone for {input_timezone}."
+        current_time =  current_time.astimezone(zone)
     return f"The current time is {current_time}."
 
 @mcp.tool()
-def weather_tool(location: str):
+@tool_executor.offload("io")
+def TimeBatchTool(timezones: list[str]) -> dict:
+    "Provides the current time in several timezones or cities at once, e.g. Asia/Kolkata, London and Tokyo."
+    now = datetime.datetime.now(datetime.timezone.utc)
+    results = []
+    for name in timezones:
+        zone = timezone_index.resolve(name)
+        if zone is None:
+            results.append({"input": name, "error": "unknown timezone",
+                            "suggestions": timezone_index.suggestions(name)})
+        else:
+            results.append({"input": name, "timezone": zone, "time": str(now.astimezone(get_zoneinfo(zone)))})
+    return {"results": results}
+
+@mcp.tool()
+async def weather_tool(location: str):
     """Provides weather information for a given location"""
-        
-    api_key = os.getenv("OPENWEATHERMAP_API_KEY")
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={api_key}&units=metric"
-    response = requests.get(url)
-    data = response.json()
-    if data["cod"] == 200:
-        temp = data["main"]["temp"]
-        description = data["weather"][0]["description"]
-        return f"The weather in {location} is currently {description} with a temperature of {temp}°C."
-    else:
-        return f"Sorry, I couldn't find weather information for {location}."
+    return await weather_client.current_weather(location)
+
+@mcp.tool()
+async def weather_batch_tool(locations: list[str]) -> dict:
+    """Provides weather information for several locations at once, e.g. to compare the weather in different cities"""
+    return {"results": await weather_client.lookup_many(locations)}
+
+
+@mcp.custom_route("/weather/stats", methods=["GET"])
+async def weather_stats(request):
+    return JSONResponse(weather_client.stats())
+
+@mcp.custom_route("/tools/stats", methods=["GET"])
+async def tool_stats(request):
+    return JSONResponse(tool_executor.stats())
+
+
+def create_app():
+    app = mcp.streamable_http_app()
+    session_manager_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with session_manager_lifespan(app):
+            yield
+        # Close the pooled weather API connections and the tool worker pools on shutdown
+        await weather_client.aclose()
+        tool_executor.shutdown()
 
+    app.router.lifespan_context = lifespan
+    return app
 
 
 if __name__ == "__main__":
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(create_app(), host=mcp.settings.host, port=mcp.settings.port)
\ No newline at end of file
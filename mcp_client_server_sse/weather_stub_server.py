@@ -0,0 +1,47 @@
+"""
+Local stand-in for the OpenWeatherMap current weather endpoint, for load-testing
+weather_tool without calling (or being rate limited by) the real API.
+
+    python weather_stub_server.py --port 8300 --latency 0.2
+    WEATHER_API_BASE_URL=http://localhost:8300/data/2.5 python mcp_server_sse.py
+"""
+import argparse
+import asyncio
+import random
+
+from fastapi import FastAPI
+
+app = FastAPI()
+settings = {"latency": 0.0, "fail_rate": 0.0}
+stats = {"requests": 0}
+
+
+@app.get("/data/2.5/weather")
+async def weather(q: str, appid: str = "", units: str = "metric"):
+    stats["requests"] += 1
+    await asyncio.sleep(settings["latency"])
+    if random.random() < settings["fail_rate"]:
+        return {"cod": "404", "message": "city not found"}
+    return {
+        "cod": 200,
+        "name": q,
+        "main": {"temp": round(random.uniform(-5, 35), 1)},
+        "weather": [{"description": random.choice(["clear sky", "few clouds", "light rain"])}],
+    }
+
+
+@app.get("/stats")
+async def request_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8300)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with city not found")
+    args = parser.parse_args()
+    settings.update(latency=args.latency, fail_rate=args.fail_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port)
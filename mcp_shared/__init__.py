@@ -0,0 +1,5 @@
+"""
+Code shared by the MCP servers in this repo: the pooled weather API client, the
+local timezone index and the worker pool for blocking tools. The servers add the
+repo root to sys.path, so they can still be started from their own directory.
+"""
@@ -0,0 +1,137 @@
+import datetime
+import difflib
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, available_timezones
+
+_NON_WORD = re.compile(r"[^a-z0-9+]+")
+# "GMT+5", "UTC-03:30", "utc +9"
+_UTC_OFFSET = re.compile(r"^\s*(?:utc|gmt)\s*([+\-\u2212])\s*(\d{1,2})(?::?(\d{2}))?\s*$", re.I)
+_REGIONS = {"Africa", "America", "Antarctica", "Asia", "Atlantic", "Australia", "Europe", "Indian", "Pacific"}
+# Words that can follow a city name without naming a different place ("Frankfurt am Main", "Panama City")
+_SUFFIXES = {"city", "am main", "sar", "downtown", "metro"}
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "city_timezones.txt")
+
+
+def normalize(name: str) -> str:
+    # "São Paulo", "sao_paulo" and "Sao-Paulo " all become "sao paulo"
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode().lower()
+    return _NON_WORD.sub(" ", name.replace("'", "")).strip()
+
+
+class TimezoneIndex:
+    """
+    City / country / alias name -> IANA timezone, built from every IANA zone name
+    plus the alias data file. Loaded on first use; exact lookups are a dict hit,
+    fuzzy lookups (typos) fall back to difflib and are memoized.
+    """
+
+    def __init__(self, path: str = DATA_FILE, fuzzy_cutoff: float = 0.8):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self._names: Optional[Dict[str, str]] = None
+
+    @property
+    def names(self) -> Dict[str, str]:
+        if self._names is None:
+            self._names = self._load()
+        return self._names
+
+    def _load(self) -> Dict[str, str]:
+        names = {}
+        zones = available_timezones()
+        for zone in zones:
+            names[normalize(zone)] = zone
+        for zone in zones:
+            # "America/Argentina/Buenos_Aires" -> "buenos aires"; legacy zones like
+            # Canada/Atlantic or US/Pacific are not cities and only match by full name
+            if zone.split("/", 1)[0] in _REGIONS:
+                names.setdefault(normalize(zone.rsplit("/", 1)[-1]), zone)
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                zone, aliases = line.split("|", 1)
+                if zone not in zones:
+                    continue
+                for alias in aliases.split(","):
+                    names[normalize(alias)] = zone
+        return names
+
+    @lru_cache(maxsize=4096)
+    def resolve(self, name: str) -> Optional[str]:
+        """The IANA zone for a zone name, city, country or alias, or None if nothing is close."""
+        offset = parse_utc_offset(name)
+        if offset is not None:
+            return offset
+        key = normalize(name)
+        if not key:
+            return None
+        zone = self.names.get(key)
+        if zone is not None:
+            return zone
+        # "Bangalore, India" / "Frankfurt am Main": a comma part or shorter word prefix, as
+        # long as the rest agrees with it ("Paris Texas" must not become Europe/Paris)
+        parts = [part for part in (normalize(part) for part in name.split(",")) if part]
+        for i, part in enumerate(parts if len(parts) > 1 else []):
+            zone = self._qualified(part, parts[:i] + parts[i + 1:])
+            if zone is not None:
+                return zone
+        words = key.split()
+        for i in range(len(words) - 1, 0, -1):
+            zone = self._qualified(" ".join(words[:i]), [" ".join(words[i:])])
+            if zone is not None:
+                return zone
+        if len(key) < 5 or any(char.isdigit() for char in key):
+            # Too short to tell a typo from a different place ("mars" is close to "madras"),
+            # and a number is never a typo ("gmt+15" is not UTC)
+            return None
+        matches = difflib.get_close_matches(key, self.names.keys(), n=1, cutoff=self.fuzzy_cutoff)
+        return self.names[matches[0]] if matches else None
+
+    def _qualified(self, head: str, rest: List[str]) -> Optional[str]:
+        zone = self.names.get(head)
+        if zone is None:
+            return None
+        if all(part in _SUFFIXES or self.names.get(part) == zone for part in rest):
+            return zone
+        return None
+
+    def zone(self, name: str) -> Optional[datetime.tzinfo]:
+        zone = self.resolve(name)
+        return get_zoneinfo(zone) if zone is not None else None
+
+    def suggestions(self, name: str, n: int = 3) -> List[str]:
+        matches = difflib.get_close_matches(normalize(name), self.names.keys(), n=n, cutoff=0.6)
+        return [self.names[match] for match in matches]
+
+
+def parse_utc_offset(name: str) -> Optional[str]:
+    """"GMT+5" -> "UTC+05:00", or None if `name` is not a valid UTC offset."""
+    match = _UTC_OFFSET.match(name or "")
+    if match is None:
+        return None
+    sign, hours, minutes = match.group(1), int(match.group(2)), int(match.group(3) or 0)
+    if hours > 14 or minutes >= 60 or (hours == 14 and minutes):
+        return None
+    if hours == minutes == 0:
+        return "UTC"
+    return f"UTC{'+' if sign == '+' else '-'}{hours:02d}:{minutes:02d}"
+
+
+@lru_cache(maxsize=None)
+def get_zoneinfo(zone: str) -> datetime.tzinfo:
+    # IANA zones, plus the fixed "UTC+05:30" offsets produced by parse_utc_offset
+    match = re.fullmatch(r"UTC([+-])(\d{2}):(\d{2})", zone)
+    if match is not None:
+        offset = datetime.timedelta(hours=int(match.group(2)), minutes=int(match.group(3)))
+        return datetime.timezone(-offset if match.group(1) == "-" else offset, zone)
+    return ZoneInfo(zone)
+
+
+timezone_index = TimezoneIndex()
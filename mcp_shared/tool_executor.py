@@ -0,0 +1,210 @@
+import asyncio
+import functools
+import importlib.util
+import inspect
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from loguru import logger
+
+IO = "io"
+CPU = "cpu"
+
+# Modules a process pool worker had to import itself, keyed by source file
+_LOADED: Dict[str, object] = {}
+
+
+def _load_module(path: str):
+    # A spawned worker has already imported the server script if it was run as __main__,
+    # otherwise import the file under a private name
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and os.path.abspath(module_file) == path:
+            return module
+    if path not in _LOADED:
+        spec = importlib.util.spec_from_file_location(f"_mcp_tool_{len(_LOADED)}", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _LOADED[path] = module
+    return _LOADED[path]
+
+
+def _call_in_worker(path: str, qualname: str, args: tuple, kwargs: dict):
+    # Functions under @mcp.tool() are not picklable, so the worker looks the tool up
+    # by source file and qualified name and calls the undecorated function
+    target = _load_module(path)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return inspect.unwrap(target)(*args, **kwargs)
+
+
+class ToolBusyError(RuntimeError):
+    pass
+
+
+class ToolStats:
+    def __init__(self, kind: str, max_concurrency: int):
+        self.kind = kind
+        self.max_concurrency = max_concurrency
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+        self.total_run_s = 0.0
+        self.max_run_s = 0.0
+
+    def as_dict(self) -> dict:
+        calls = self.completed + self.failed
+        return {
+            "kind": self.kind,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_s / calls * 1000, 2) if calls else 0.0,
+            "avg_run_ms": round(self.total_run_s / calls * 1000, 2) if calls else 0.0,
+            "max_run_ms": round(self.max_run_s * 1000, 2),
+        }
+
+
+class ToolExecutor:
+    """
+    Runs synchronous MCP tools off the server's event loop: I/O-bound tools on a
+    bounded thread pool, CPU-bound tools on a process pool. Each tool has its own
+    concurrency limit and queue timeout; `metrics_hook(event)` is called after
+    every call with its queue and run times.
+
+    The process pool starts on the first CPU call, which pays for spawning the
+    workers and importing the tool's module in them (a few seconds for a server
+    script), so keep cheap tools inline or on the thread pool.
+    """
+
+    def __init__(self, max_threads: int = 8, max_processes: int = 2, queue_timeout: float = 10.0,
+                 metrics_hook: Optional[Callable[[dict], None]] = None, start_method: str = "spawn"):
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.queue_timeout = queue_timeout
+        self.metrics_hook = metrics_hook
+        self.start_method = start_method
+        self.tools: Dict[str, ToolStats] = {}
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self, kind: str):
+        if kind == CPU:
+            if self._processes is None:
+                # spawn, not fork: the server process is multi-threaded by the time the pool starts
+                self._processes = ProcessPoolExecutor(max_workers=self.max_processes,
+                                                      mp_context=multiprocessing.get_context(self.start_method))
+            return self._processes
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="mcp-tool")
+        return self._threads
+
+    def offload(self, kind: str = IO, max_concurrency: Optional[int] = None, queue_timeout: Optional[float] = None):
+        """
+        Decorator for a synchronous tool function, applied under @mcp.tool():
+
+            @mcp.tool()
+            @tool_executor.offload("cpu", max_concurrency=2)
+            def heavy_tool(...): ...
+        """
+        if kind not in (IO, CPU):
+            raise ValueError(f"kind must be {IO!r} or {CPU!r}, got {kind!r}")
+
+        def decorator(fn: Callable):
+            name = fn.__name__
+            if kind == CPU:
+                if "<locals>" in fn.__qualname__:
+                    raise ValueError(f"{name} must be defined at module level to run on the process pool")
+                source = os.path.abspath(inspect.getfile(fn))
+            limit = max_concurrency or (self.max_processes if kind == CPU else self.max_threads)
+            stats = self.tools[name] = ToolStats(kind, limit)
+            self._limits[name] = asyncio.Semaphore(limit)
+            timeout = self.queue_timeout if queue_timeout is None else queue_timeout
+
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                enqueued_at = time.monotonic()
+                stats.queued += 1
+                try:
+                    await asyncio.wait_for(self._limits[name].acquire(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    stats.rejected += 1
+                    self._report(name, stats, ok=False, wait_s=time.monotonic() - enqueued_at, run_s=0.0)
+                    raise ToolBusyError(f"{name} is busy, no slot became free within {timeout}s") from None
+                finally:
+                    stats.queued -= 1
+                started_at = time.monotonic()
+                stats.running += 1
+                ok = False
+                try:
+                    loop = asyncio.get_running_loop()
+                    if kind == CPU:
+                        call = functools.partial(_call_in_worker, source, fn.__qualname__, args, kwargs)
+                    else:
+                        call = functools.partial(fn, *args, **kwargs)
+                    result = await loop.run_in_executor(self._pool(kind), call)
+                    ok = True
+                    return result
+                finally:
+                    stats.running -= 1
+                    self._limits[name].release()
+                    run_s = time.monotonic() - started_at
+                    if ok:
+                        stats.completed += 1
+                    else:
+                        stats.failed += 1
+                    stats.total_wait_s += started_at - enqueued_at
+                    stats.total_run_s += run_s
+                    stats.max_run_s = max(stats.max_run_s, run_s)
+                    self._report(name, stats, ok=ok, wait_s=started_at - enqueued_at, run_s=run_s)
+
+            return wrapper
+
+        return decorator
+
+    def _report(self, name: str, stats: ToolStats, ok: bool, wait_s: float, run_s: float):
+        if self.metrics_hook is None:
+            return
+        try:
+            self.metrics_hook({"tool": name, "kind": stats.kind, "ok": ok, "wait_s": wait_s, "run_s": run_s,
+                               "queued": stats.queued, "running": stats.running})
+        except Exception as e:
+            logger.warning(f"Tool metrics hook failed: {e}")
+
+    def stats(self) -> dict:
+        return {name: stats.as_dict() for name, stats in self.tools.items()}
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+
+def log_slow_calls(threshold_s: float) -> Callable[[dict], None]:
+    """Metrics hook that logs calls which queued or ran longer than `threshold_s`."""
+    def hook(event: dict):
+        if event["wait_s"] + event["run_s"] >= threshold_s:
+            logger.info(f"Slow tool call {event['tool']}: queued {event['wait_s'] * 1000:.0f}ms, "
+                        f"ran {event['run_s'] * 1000:.0f}ms, {event['queued']} queued / {event['running']} running")
+    return hook
+
+
+def tool_executor_from_env() -> ToolExecutor:
+    return ToolExecutor(
+        max_threads=int(os.getenv("TOOL_THREAD_WORKERS", "8")),
+        max_processes=int(os.getenv("TOOL_PROCESS_WORKERS", "2")),
+        queue_timeout=float(os.getenv("TOOL_QUEUE_TIMEOUT_S", "10")),
+        metrics_hook=log_slow_calls(float(os.getenv("TOOL_SLOW_CALL_S", "1"))),
+    )
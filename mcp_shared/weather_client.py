@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+TIMEOUT_ERROR = "the weather service did not respond in time"
+
+
+def location_key(location: str) -> str:
+    # "  New  York" and "new york" are the same city
+    return " ".join((location or "").lower().split())
+
+
+class WeatherCache:
+    """
+    Per-location TTL cache with single-flight fetching. Concurrent misses for the
+    same location share one upstream request; an entry past its TTL but within
+    `stale_ttl` is served as is while one background fetch refreshes it.
+    """
+
+    def __init__(self, ttl: float = 300.0, stale_ttl: float = 600.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.upstream_errors = 0
+
+    async def get(self, location: str, fetch: Callable[[str], Awaitable[dict]]) -> dict:
+        key = location_key(location)
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    self.refreshes += 1
+                    self._start_fetch(key, location, fetch)
+                return entry[1]
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            self._start_fetch(key, location, fetch)
+        # shield: one caller giving up must not cancel the fetch the others are waiting on
+        return await asyncio.shield(self._inflight[key])
+
+    def _start_fetch(self, key: str, location: str, fetch: Callable[[str], Awaitable[dict]]):
+        task = asyncio.create_task(self._fetch(key, location, fetch))
+        # A background refresh may fail with nobody waiting on it, it is counted in upstream_errors
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+
+    async def _fetch(self, key: str, location: str, fetch: Callable[[str], Awaitable[dict]]) -> dict:
+        try:
+            data = await fetch(location)
+        except Exception:
+            self.upstream_errors += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        # Only real answers are cached, an unknown city or upstream error is asked again next time
+        if str(data.get("cod")) == "200":
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+            "upstream_errors": self.upstream_errors,
+            "hit_rate": round((self.hits + self.stale_hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+class WeatherClient:
+    """
+    Async OpenWeatherMap client on one pooled httpx client, shared by every MCP
+    session of the server process. Connections are kept alive between calls and
+    every request has connect / read timeouts, so a slow upstream can only hold
+    up the tool calls waiting on it.
+    """
+
+    def __init__(self, base_url: str, api_key: Optional[str], connect_timeout: float = 3.0,
+                 read_timeout: float = 10.0, max_connections: int = 50, max_keepalive: int = 20,
+                 cache: Optional[WeatherCache] = None, batch_concurrency: int = 5, batch_max_locations: int = 20):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.cache = cache
+        self.batch_concurrency = batch_concurrency
+        self.batch_max_locations = batch_max_locations
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the server's running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def fetch(self, location: str) -> dict:
+        response = await self.client.get("/weather", params={"q": location, "appid": self.api_key, "units": "metric"})
+        return response.json()
+
+    async def lookup(self, location: str) -> dict:
+        """Current weather for one location as a dict, with an "error" key instead of raising."""
+        try:
+            data = await (self.cache.get(location, self.fetch) if self.cache is not None else self.fetch(location))
+        except httpx.TimeoutException:
+            logger.warning(f"Weather API timed out for {location}")
+            return {"location": location, "error": TIMEOUT_ERROR}
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Weather API request failed for {location}: {e}")
+            return {"location": location, "error": "weather information is not available"}
+        if str(data.get("cod")) == "200":
+            return {"location": location, "description": data["weather"][0]["description"],
+                    "temperature_c": data["main"]["temp"]}
+        return {"location": location, "error": "location not found"}
+
+    async def current_weather(self, location: str) -> str:
+        result = await self.lookup(location)
+        if "error" not in result:
+            return (f"The weather in {location} is currently {result['description']} "
+                    f"with a temperature of {result['temperature_c']}°C.")
+        if result["error"] == TIMEOUT_ERROR:
+            return f"Sorry, the weather service did not respond in time for {location}."
+        return f"Sorry, I couldn't find weather information for {location}."
+
+    async def lookup_many(self, locations: List[str]) -> List[dict]:
+        """One result per requested location, in order; at most `batch_concurrency` fetches run at once."""
+        if len(locations) > self.batch_max_locations:
+            raise ValueError(f"at most {self.batch_max_locations} locations can be looked up at once")
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def bounded(location: str) -> dict:
+            async with semaphore:
+                return await self.lookup(location)
+
+        # Repeats of a city in one batch share a lookup
+        unique = {location_key(location): location for location in reversed(locations)}
+        results = dict(zip(unique, await asyncio.gather(*(bounded(location) for location in unique.values()))))
+        return [dict(results[location_key(location)], location=location) for location in locations]
+
+    def stats(self) -> dict:
+        return self.cache.stats() if self.cache is not None else {}
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def weather_client_from_env() -> WeatherClient:
+    # Weather changes on the order of minutes; WEATHER_CACHE_TTL_S=0 turns the cache off
+    cache_ttl = float(os.getenv("WEATHER_CACHE_TTL_S", "300"))
+    cache = WeatherCache(
+        ttl=cache_ttl,
+        stale_ttl=float(os.getenv("WEATHER_CACHE_STALE_TTL_S", "600")),
+        max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "1000")),
+    ) if cache_ttl > 0 else None
+    return WeatherClient(
+        # Point this at a local stub (e.g. weather_stub_server.py) to load-test without the real API
+        base_url=os.getenv("WEATHER_API_BASE_URL", "http://api.openweathermap.org/data/2.5"),
+        api_key=os.getenv("OPENWEATHERMAP_API_KEY"),
+        connect_timeout=float(os.getenv("WEATHER_HTTP_CONNECT_TIMEOUT_S", "3")),
+        read_timeout=float(os.getenv("WEATHER_HTTP_READ_TIMEOUT_S", "10")),
+        max_connections=int(os.getenv("WEATHER_HTTP_MAX_CONNECTIONS", "50")),
+        max_keepalive=int(os.getenv("WEATHER_HTTP_MAX_KEEPALIVE", "20")),
+        cache=cache,
+        batch_concurrency=int(os.getenv("WEATHER_BATCH_CONCURRENCY", "5")),
+        batch_max_locations=int(os.getenv("WEATHER_BATCH_MAX_LOCATIONS", "20")),
+    )
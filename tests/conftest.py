@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The example apps are flat scripts, not packages: put the repo root (for mcp_shared)
+# and the chat app's directory on sys.path so the tests can import them directly
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT_APP = os.path.join(ROOT, "mcp_chat_ux_stdio_sse")
+sys.path[:0] = [ROOT, CHAT_APP]
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from conftest import CHAT_APP
+from llm_backend import LLMBackendPool
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_stub(*args) -> (subprocess.Popen, str):
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(CHAT_APP, "ollama_stub_server.py"),
+                                "--port", str(port), *args],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    host = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{host}/api/version", timeout=1)
+            return process, host
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"ollama stub on port {port} did not start")
+
+
+@pytest.fixture(scope="module")
+def stubs():
+    failing, failing_host = _start_stub("--fail-rate", "1")
+    healthy, healthy_host = _start_stub()
+    yield failing_host, healthy_host
+    for process in (failing, healthy):
+        process.kill()
+        process.wait()
+
+
+def test_failing_endpoint_is_ejected_and_readmitted(stubs):
+    failing_host, _ = stubs
+
+    async def run():
+        pool = LLMBackendPool([failing_host], max_failures=2, health_check_interval=0.5)
+        endpoint = pool.endpoints[0]
+        for _ in range(pool.max_failures):
+            assert endpoint.healthy
+            with pytest.raises(Exception):
+                await pool.chat(MESSAGES)
+        assert not endpoint.healthy
+        # /api/tags still answers, so the health check lets it back in after one interval
+        await asyncio.sleep(1.5)
+        assert endpoint.healthy and endpoint.consecutive_failures == 0
+        pool._health_task.cancel()
+
+    asyncio.run(run())
+
+
+def test_failed_request_is_retried_on_another_endpoint(stubs):
+    failing_host, healthy_host = stubs
+
+    async def run():
+        pool = LLMBackendPool([failing_host, healthy_host], max_failures=3)
+        reply = await pool.chat(MESSAGES)
+        pool._health_task.cancel()
+        return reply, pool.stats()
+
+    reply, (failing, healthy) = asyncio.run(run())
+    assert "ollama stub" in reply
+    assert failing["failures"] == 1 and failing["healthy"]
+    assert healthy["requests"] == 1 and healthy["failures"] == 0
@@ -0,0 +1,85 @@
+import pytest
+
+from decision_cache import normalize_query
+from mcp_shared.timezone_index import TimezoneIndex
+from tool_arguments import ArgumentValidator
+
+
+@pytest.mark.parametrize("a, b", [
+    ("What's the time in  Bengaluru?", "whats the time in bengaluru"),
+    ("Weather in Paris!", "weather in paris"),
+    ("it’s cold in Oslo...", "its cold in oslo"),
+])
+def test_normalize_query_folds_case_spacing_and_punctuation(a, b):
+    assert normalize_query(a) == normalize_query(b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("BMI for 70.5kg and 1.75m", "BMI for 705kg and 175m"),
+    ("time in GMT+5", "time in GMT-5"),
+    ("weather in Paris", "weather in Perth"),
+])
+def test_normalize_query_keeps_arguments_apart(a, b):
+    assert normalize_query(a) != normalize_query(b)
+
+
+@pytest.fixture(scope="module")
+def timezones():
+    return TimezoneIndex()
+
+
+@pytest.mark.parametrize("name, zone", [
+    ("Paris", "Europe/Paris"),
+    ("paris, france", "Europe/Paris"),
+    ("Pariss", "Europe/Paris"),
+    ("Bengaluru", "Asia/Kolkata"),
+    ("Bangalore", "Asia/Kolkata"),
+    ("New York", "America/New_York"),
+    ("Europe/Berlin", "Europe/Berlin"),
+    ("GMT+5", "UTC+05:00"),
+    ("UTC-03:30", "UTC-03:30"),
+    ("gmt+0", "UTC"),
+    ("GMT+15", None),
+    ("UTC+5:60", None),
+    ("NY5", None),
+    ("Paris Texas", None),
+    ("Nowhere", None),
+])
+def test_timezone_resolve(timezones, name, zone):
+    assert timezones.resolve(name) == zone
+
+
+@pytest.fixture(scope="module")
+def validator():
+    return ArgumentValidator({
+        "type": "object",
+        "properties": {
+            "weight_kg": {"type": "number"},
+            "count": {"type": "integer"},
+            "metric": {"type": "boolean"},
+        },
+        "required": ["weight_kg"],
+    })
+
+
+@pytest.mark.parametrize("arguments, expected", [
+    ({"weight_kg": "70"}, {"weight_kg": 70.0}),
+    ({"weight_kg": "1,250"}, {"weight_kg": 1250.0}),
+    ({"weight_kg": 70, "count": "3"}, {"weight_kg": 70, "count": 3}),
+    ({"weight_kg": 70, "metric": "yes"}, {"weight_kg": 70, "metric": True}),
+])
+def test_argument_validator_coerces(validator, arguments, expected):
+    assert validator(arguments) == (expected, None)
+
+
+@pytest.mark.parametrize("arguments", [
+    {"weight_kg": "1,75"},
+    {"weight_kg": "nan"},
+    {"weight_kg": "inf"},
+    {"weight_kg": True},
+    {"weight_kg": 70, "count": 2.5},
+    {},
+])
+def test_argument_validator_rejects(validator, arguments):
+    coerced, error = validator(arguments)
+    assert coerced is None and error